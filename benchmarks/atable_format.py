@@ -0,0 +1,124 @@
+"""
+Rendering time of tapclient's ATable on wide tables, with rounding and truncation enabled.
+
+Each cell goes through its value formatter, the number of formatter calls per cell is reported along with the best
+time of --repeat renderings. --compare loads another version of atable.py to render the same table, e.g. the one of
+a previous commit, and reports the speedup:
+    git show HEAD~1:misc-modules/tapclient/atable.py > /tmp/atable_before.py
+    python benchmarks/atable_format.py --compare /tmp/atable_before.py
+
+--columnar gives the table to ATable as a dict of columns, the numbers in numpy arrays, while the compared version
+still renders the list of rows, e.g. for a frame of 100k rows and 50 columns:
+    python benchmarks/atable_format.py --rows 100000 --columns 50 --repeat 1 --columnar --compare /tmp/atable_before.py
+
+Run it with the python 2 environment of the notebook server, e.g.:
+    python benchmarks/atable_format.py --rows 2000 --columns 40
+"""
+
+import argparse
+import imp
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc-modules', 'tapclient'))
+
+import atable
+
+
+def create_table(num_rows, num_columns, seed):
+    """
+    :return: rows and schema of a table of float, str and int columns, some strings spanning several lines
+    """
+    rnd = random.Random(seed)
+    types = [float, str, int]
+    schema = [('column_%d' % c, types[c % len(types)]) for c in xrange(num_columns)]
+    values = {
+        float: lambda: rnd.random() * 10 ** rnd.randint(0, 6),
+        str: lambda: ' '.join('word%d' % rnd.randint(0, 1000) for _ in xrange(rnd.randint(1, 8))) +
+        ('\nsecond line' if rnd.random() < 0.05 else ''),
+        int: lambda: rnd.randint(-10 ** 6, 10 ** 6)
+    }
+    rows = [[values[data_type]() for name, data_type in schema] for _ in xrange(num_rows)]
+    return rows, schema
+
+
+def to_columns(rows, schema):
+    """
+    :return: the dict of the columns of the rows by name, the float and int columns as numpy arrays
+    """
+    import numpy
+    columns = {}
+    for c, (name, data_type) in enumerate(schema):
+        values = [row[c] for row in rows]
+        columns[name] = numpy.array(values) if data_type in (float, int) else values
+    return columns
+
+
+def count_formatter_calls(table):
+    """wraps the value formatters of the table to count their calls"""
+    calls = [0]
+
+    def counting(formatter):
+        def counted(value):
+            calls[0] += 1
+            return formatter(value)
+        return counted
+
+    table.value_formatters = [counting(formatter) for formatter in table.value_formatters]
+    return calls
+
+
+def measure(module, rows, schema, formatting, repeat):
+    """
+    :return: the best rendering time in seconds and the formatter calls per cell
+    """
+    best = None
+    for _ in xrange(repeat):
+        table = module.ATable(rows, schema, 0, module.Formatting(**formatting))
+        start = time.time()
+        repr(table)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    table = module.ATable(rows, schema, 0, module.Formatting(**formatting))
+    calls = count_formatter_calls(table)
+    repr(table)
+    return best, calls[0] / float(len(table.rows) * len(schema))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000, help='number of rows of the table')
+    parser.add_argument('--columns', type=int, default=40, help='number of columns of the table')
+    parser.add_argument('--wrap', type=int, default=20, help='rows per clump')
+    parser.add_argument('--round', type=int, default=2, help='digits of the rounded floats')
+    parser.add_argument('--truncate', type=int, default=12, help='length of the truncated strings')
+    parser.add_argument('--width', type=int, default=120, help='line width')
+    parser.add_argument('--repeat', type=int, default=5, help='number of renderings, the best time is reported')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated values')
+    parser.add_argument('--columnar', action='store_true', help='render the table from a dict of columns')
+    parser.add_argument('--compare', help='path to another atable.py rendering the same table from its rows')
+    args = parser.parse_args()
+
+    rows, schema = create_table(args.rows, args.columns, args.seed)
+    data = to_columns(rows, schema) if args.columnar else rows
+    formatting = {'wrap': args.wrap, 'round': args.round, 'truncate': args.truncate, 'width': args.width}
+    elapsed, calls_per_cell = measure(atable, data, schema, formatting, args.repeat)
+    report = {'cells': args.rows * args.columns,
+              'render-s': round(elapsed, 4),
+              'formatter-calls-per-cell': round(calls_per_cell, 2)}
+    if args.compare:
+        other = imp.load_source('atable_compared', args.compare)
+        other_elapsed, other_calls_per_cell = measure(other, rows, schema, formatting, args.repeat)
+        report['compared'] = {'render-s': round(other_elapsed, 4),
+                              'formatter-calls-per-cell': round(other_calls_per_cell, 2),
+                              'same-output': repr(atable.ATable(data, schema, 0, atable.Formatting(**formatting))) ==
+                              repr(other.ATable(rows, schema, 0, other.Formatting(**formatting)))}
+        report['speedup'] = round(other_elapsed / elapsed, 2) if elapsed else None
+    print json.dumps(report, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Shared setup of the sparktk server extension benchmarks.
+
+The extension is booted in-process, in a temporary working directory holding its uploads directory, fake jars under
+SPARK_HOME and SPARKTK_HOME, and a fake spark-submit on the PATH that prints a line and sleeps. Apps are generated
+directly on disk, with their STATUS.log and LOG.log, before the extension loads and imports them.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import jinja2
+from tornado import gen
+from tornado.httpclient import HTTPError
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+from tornado.web import Application
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc-modules', 'sparktk-ext'))
+
+FAKE_SPARK_SUBMIT = """#!/bin/sh
+for arg; do driver=$arg; done
+echo "fake spark-submit running $driver"
+sleep %s
+"""
+
+
+def create_fake_spark(work_dir, num_jars, sleep_s=1):
+    """
+    :param work_dir: directory receiving bin/spark-submit and the spark and sparktk homes
+    :param num_jars: number of empty jars in each home, spread over 50 directories
+    :param sleep_s: seconds each fake spark-submit runs
+    :return: None
+    """
+    bin_dir = os.path.join(work_dir, 'bin')
+    os.makedirs(bin_dir)
+    with open(os.path.join(bin_dir, 'spark-submit'), 'w') as f:
+        f.write(FAKE_SPARK_SUBMIT % sleep_s)
+    os.chmod(os.path.join(bin_dir, 'spark-submit'), 0755)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    for home in ('spark', 'sparktk'):
+        for i in xrange(num_jars):
+            jar_dir = os.path.join(work_dir, home, 'lib', str(i % 50))
+            if not os.path.isdir(jar_dir):
+                os.makedirs(jar_dir)
+            open(os.path.join(jar_dir, 'dep-%d.jar' % i), 'w').close()
+    os.environ['SPARK_HOME'] = os.path.join(work_dir, 'spark')
+    os.environ['SPARKTK_HOME'] = os.path.join(work_dir, 'sparktk')
+
+
+def create_apps(num_apps, num_files, log_lines, first=0):
+    """
+    writes completed apps in the uploads directory
+    :param num_apps: number of apps created
+    :param num_files: number of empty files in each app, besides driver.py
+    :param log_lines: number of lines in the log of each app
+    :param first: number of the first app directory
+    :return: list of the app directories
+    """
+    import sparktk_ext
+    log = ''.join('log line %d of a long running spark job\n' % n for n in xrange(log_lines))
+    app_dirs = []
+    for i in xrange(first, first + num_apps):
+        app_dir = sparktk_ext.APP_SETTINGS['UPLOADS_PATH'] + '/%04d' % i
+        os.makedirs(app_dir)
+        for j in xrange(num_files):
+            open(os.path.join(app_dir, 'part-%05d' % j), 'w').close()
+        with open(os.path.join(app_dir, 'driver.py'), 'w') as f:
+            f.write('print "hello"\n')
+        with open(os.path.join(app_dir, sparktk_ext.LOG_FILE), 'w') as f:
+            f.write(log)
+        sparktk_ext.update_status(app_dir + '/driver.py', sparktk_ext.APP_STATUS['COMPLETED'])
+        app_dirs.append(app_dir)
+    return app_dirs
+
+
+class FakeNotebookApp(object):
+    def __init__(self):
+        self.log = logging.getLogger('benchmark')
+        self.web_app = Application([], base_url='/', log=self.log,
+                                   jinja2_env=jinja2.Environment(loader=jinja2.FileSystemLoader([])))
+
+
+class Workspace(object):
+    """
+    temporary working directory of a benchmark, with the fake spark installed, removed on exit
+    """
+
+    def __init__(self, num_jars, spark_submit_sleep_s=1):
+        self.num_jars = num_jars
+        self.spark_submit_sleep_s = spark_submit_sleep_s
+        self.work_dir = None
+        self._cwd = None
+
+    def __enter__(self):
+        self.work_dir = tempfile.mkdtemp(prefix='sparktk-ext-bench-')
+        self._cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        create_fake_spark(self.work_dir, self.num_jars, self.spark_submit_sleep_s)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.chdir(self._cwd)
+        shutil.rmtree(self.work_dir)
+
+
+class ExtensionServer(object):
+    """
+    the extension loaded in a fake notebook app, served on a local port of the current IOLoop
+    """
+
+    def __init__(self):
+        import sparktk_ext
+        self.nb_app = FakeNotebookApp()
+        sparktk_ext.load_jupyter_server_extension(self.nb_app)
+        sock, port = bind_unused_port()
+        self.url = 'http://127.0.0.1:%d' % port
+        self.server = HTTPServer(self.nb_app.web_app)
+        self.server.add_sockets([sock])
+
+    @property
+    def settings(self):
+        return self.nb_app.web_app.settings
+
+    def stop(self):
+        self.server.stop()
+        for name in ('sparktk_metrics', 'sparktk_reaper'):
+            self.settings[name].stop()
+        if self.settings['sparktk_driver_pool'] is not None:
+            self.settings['sparktk_driver_pool'].shutdown()
+        self.settings['sparktk_scheduler'].shutdown(wait=True)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+class EndpointStats(object):
+    """
+    latencies of the requests sent to an endpoint
+    """
+
+    def __init__(self):
+        self.latencies = []  # seconds
+        self.errors = 0
+        self.first_error = None  # reason of the first failed request
+        self.elapsed = 0.0
+
+    def add_error(self, reason):
+        self.errors += 1
+        if self.first_error is None:
+            self.first_error = reason
+
+    def report(self):
+        """
+        :return: dict of the request count, errors, throughput and latency percentiles
+        """
+        latencies_ms = [latency * 1000 for latency in self.latencies]
+        return {
+            'requests': len(self.latencies),
+            'errors': self.errors,
+            'first-error': self.first_error,
+            'elapsed-s': round(self.elapsed, 3),
+            'throughput-rps': round(len(self.latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            'p50-ms': round(percentile(latencies_ms, 50), 2),
+            'p99-ms': round(percentile(latencies_ms, 99), 2),
+            'max-ms': round(max(latencies_ms or [0.0]), 2)
+        }
+
+
+def check_text(response):
+    """
+    the handlers answer most failures with a 200 whose body starts with "Error, ..." or "Pass, ..."
+    :param response: HTTPResponse of the extension
+    :return: the reason the request failed, None if it succeeded
+    """
+    if response.body.startswith(('Error', 'Pass')):
+        return response.body.splitlines()[0]
+    return None
+
+
+def check_json(response):
+    """
+    :param response: HTTPResponse of the extension
+    :return: the reason the request failed, None if it succeeded with a json body
+    """
+    reason = check_text(response)
+    if reason is None:
+        try:
+            json.loads(response.body)
+        except ValueError:
+            return 'invalid json: %s' % response.body[:200]
+    return reason
+
+
+@gen.coroutine
+def run_load(client, stats, make_request, num_requests, concurrency, check_response=check_text):
+    """
+    sends num_requests requests, concurrency of them at a time, and records their latency
+    :param client: AsyncHTTPClient allowing at least concurrency connections
+    :param stats: EndpointStats receiving the latencies
+    :param make_request: function of the request number returning the HTTPRequest to send
+    :param num_requests: number of requests sent
+    :param concurrency: number of clients sending requests one after the other
+    :param check_response: function of the HTTPResponse returning the reason the request failed, None if it succeeded
+    :return: None
+    """
+    pending = iter(xrange(num_requests))
+
+    @gen.coroutine
+    def client_loop():
+        for number in pending:
+            request = make_request(number)
+            start = time.time()
+            try:
+                response = yield client.fetch(request)
+            except HTTPError as e:
+                stats.add_error('HTTP %d' % e.code)
+            else:
+                reason = check_response(response)
+                if reason is not None:
+                    stats.add_error(reason)
+            stats.latencies.append(time.time() - start)
+
+    start = time.time()
+    yield [client_loop() for _ in xrange(concurrency)]
+    stats.elapsed += time.time() - start
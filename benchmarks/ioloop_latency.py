@@ -0,0 +1,83 @@
+"""
+IOLoop responsiveness of the sparktk server extension under concurrent /delete, /logs, /logs/follow and /spark-submit
+load.
+
+The handlers are booted in-process against a temporary uploads directory, with a fake spark-submit on the PATH.
+The /logs/follow clients start at since=0 on the submitted apps, so they also read their logs from the start.
+While the requests are in flight a periodic callback measures how late the IOLoop runs it: that lag is what every
+other notebook, kernel websocket and API call on the server would wait.
+
+Run it with the python 2 environment of the notebook server, e.g.:
+    python benchmarks/ioloop_latency.py --apps 50 --files 2000 --log-lines 200000
+"""
+
+import argparse
+import json
+import time
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from harness import ExtensionServer, Workspace, create_apps, percentile
+
+
+@gen.coroutine
+def run(url, app_dirs, interval_ms, follow_clients):
+    client = AsyncHTTPClient(max_clients=len(app_dirs) * 3 + follow_clients)
+    lags = []
+    last_tick = [time.time()]
+
+    def tick():
+        now = time.time()
+        lags.append(max(0.0, (now - last_tick[0]) * 1000 - interval_ms))
+        last_tick[0] = now
+
+    sampler = PeriodicCallback(tick, interval_ms)
+    sampler.start()
+    start = time.time()
+    requests = []
+    for app_dir in app_dirs[1::2]:
+        requests.append(client.fetch(url + '/delete', method='POST', body='app-path=' + app_dir))
+    for app_dir in app_dirs[::2]:
+        requests.append(client.fetch(url + '/logs', method='POST', body='app-path=%s&offset=-1000&n=-1' % app_dir))
+        requests.append(client.fetch(url + '/spark-submit', method='POST', body='driver-path=%s/driver.py' % app_dir))
+    submitted = app_dirs[::2]
+    for number in xrange(follow_clients):
+        requests.append(client.fetch(url + '/logs/follow?app-path=%s&since=0&timeout=2' %
+                                     submitted[number % len(submitted)], request_timeout=600))
+    yield requests
+    elapsed = time.time() - start
+    sampler.stop()
+    raise gen.Return((elapsed, len(requests), lags))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int, default=40, help='number of apps created in the uploads directory')
+    parser.add_argument('--files', type=int, default=2000, help='number of files in each app (deleted by /delete)')
+    parser.add_argument('--log-lines', type=int, default=100000, help='number of lines in each app log')
+    parser.add_argument('--jars', type=int, default=2000, help='number of jars under SPARK_HOME and SPARKTK_HOME')
+    parser.add_argument('--follow-clients', type=int, default=40, help='number of /logs/follow clients')
+    parser.add_argument('--interval-ms', type=float, default=5, help='period of the IOLoop lag sampler')
+    args = parser.parse_args()
+
+    with Workspace(args.jars):
+        app_dirs = create_apps(args.apps, args.files, args.log_lines)
+        server = ExtensionServer()
+        elapsed, num_requests, lags = IOLoop.current().run_sync(
+            lambda: run(server.url, app_dirs, args.interval_ms, args.follow_clients), timeout=3600)
+        server.stop()
+        print json.dumps({
+            'requests': num_requests,
+            'elapsed-s': round(elapsed, 3),
+            'ioloop-lag-ms': {
+                'p50': round(percentile(lags, 50), 2),
+                'p99': round(percentile(lags, 99), 2),
+                'max': round(max(lags or [0.0]), 2)
+            }
+        }, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Throughput and latency of the REST endpoints of the sparktk server extension.
+
+The handlers are booted in-process against a temporary uploads directory populated with completed apps (and a few
+apps with large logs), with a fake spark-submit on the PATH. Each endpoint is then loaded in turn by concurrent
+clients, and its throughput and p50/p99 latency are reported as json. A request counts as an error when it fails
+or when its body isn't the answer of a success: most handlers report failures in a 200 "Error, ..." body.
+
+The report can be saved with --output and given back as --baseline to a later run: endpoints whose p99 latency grew,
+or whose throughput dropped, by more than --tolerance are listed and the exit code is 1.
+
+Run it with the python 2 environment of the notebook server, e.g.:
+    python benchmarks/rest_endpoints.py --apps 5000 --concurrency 100 --output before.json
+    python benchmarks/rest_endpoints.py --apps 5000 --concurrency 100 --baseline before.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import urllib
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+
+from harness import EndpointStats, ExtensionServer, Workspace, check_json, check_text, create_apps, run_load
+
+ENDPOINTS = ['upload', 'status', 'apps', 'logs', 'logs-search', 'logs-follow', 'spark-submit', 'delete']
+
+BOUNDARY = 'sparktk-ext-bench-boundary'
+
+
+def multipart_body(files):
+    """
+    :param files: list of (file name, content)
+    :return: multipart/form-data body uploading the files as filearg
+    """
+    parts = ['--%s\r\nContent-Disposition: form-data; name="filearg"; filename="%s"\r\n'
+             'Content-Type: application/octet-stream\r\n\r\n%s\r\n' % (BOUNDARY, name, content)
+             for name, content in files]
+    return ''.join(parts) + '--%s--\r\n' % BOUNDARY
+
+
+def post(url, **arguments):
+    return HTTPRequest(url, method='POST', body=urllib.urlencode(arguments, doseq=True), request_timeout=600)
+
+
+def check_uploads(response):
+    """
+    :return: the reason the /upload failed, None if its body is the json status of each uploaded file
+    """
+    reason = check_text(response)
+    if reason is None:
+        decoder = json.JSONDecoder()
+        body = response.body.decode('utf-8')
+        end = 0
+        try:
+            while end < len(body):
+                end = decoder.raw_decode(body, end)[1]
+        except ValueError:
+            return 'invalid json: %s' % response.body[:200]
+    return reason
+
+
+def check_submit(response):
+    """
+    :return: the reason the /spark-submit failed, None if the job was queued or answered from the submit cache
+    """
+    if response.body.startswith('SparkSubmit Job Queued'):
+        return None
+    return check_json(response)
+
+
+class Requests(object):
+    """
+    the requests sent to each endpoint, chosen from the app population with a seeded random generator
+    """
+
+    def __init__(self, url, app_dirs, upload_bytes, seed):
+        self.url = url
+        self.app_dirs = app_dirs
+        self.jar = 'j' * upload_bytes  # the same dependency uploaded by every app, like CI does
+        self.random = random.Random(seed)
+
+    def any_app(self):
+        return self.random.choice(self.app_dirs)
+
+    def upload(self, number):
+        body = multipart_body([('driver.py', 'print "upload %d"\n' % number), ('dep.jar', self.jar)])
+        return HTTPRequest(self.url + '/upload', method='POST', body=body, request_timeout=600,
+                           headers={'Content-Type': 'multipart/form-data; boundary=%s' % BOUNDARY})
+
+    def status(self, number):
+        return post(self.url + '/status', **{'app-path': self.any_app()})
+
+    def apps(self, number):
+        return post(self.url + '/apps', limit=100)
+
+    def logs(self, number):
+        return post(self.url + '/logs', **{'app-path': self.any_app(), 'offset': -100, 'n': -1})
+
+    def logs_search(self, number):
+        return post(self.url + '/logs/search', **{'app-path': self.any_app(), 'pattern': 'line 4[0-9]{2} ',
+                                                  'context': 2, 'max-matches': 100})
+
+    def logs_follow(self, number):
+        arguments = urllib.urlencode({'app-path': self.any_app(), 'since': 0, 'timeout': 5})
+        return HTTPRequest(self.url + '/logs/follow?' + arguments, request_timeout=600)
+
+    def spark_submit(self, number):
+        return post(self.url + '/spark-submit', **{'driver-path': self.app_dirs[number % len(self.app_dirs)] +
+                                                                  '/driver.py'})
+
+    def delete(self, number):
+        return post(self.url + '/delete', **{'app-path': self.app_dirs[-1 - number % len(self.app_dirs)]})
+
+    checks = {
+        'upload': check_uploads,
+        'status': check_json,
+        'apps': check_json,
+        'logs': check_text,
+        'logs-search': check_json,
+        'logs-follow': check_json,
+        'spark-submit': check_submit,
+        'delete': check_text
+    }
+
+
+@gen.coroutine
+def wait_idle(scheduler):
+    """waits for the submitted jobs to finish, so /delete finds the apps idle"""
+    while scheduler.queue_depth() or scheduler.running_count():
+        yield gen.sleep(0.1)
+
+
+@gen.coroutine
+def run(server, requests, endpoints, num_requests, concurrency):
+    client = AsyncHTTPClient(max_clients=concurrency)
+    report = {}
+    for endpoint in endpoints:
+        if endpoint == 'delete':
+            yield wait_idle(server.settings['sparktk_scheduler'])
+        stats = EndpointStats()
+        yield run_load(client, stats, getattr(requests, endpoint.replace('-', '_')), num_requests, concurrency,
+                       check_response=Requests.checks[endpoint])
+        report[endpoint] = stats.report()
+    raise gen.Return(report)
+
+
+def find_regressions(report, baseline, tolerance):
+    """
+    :return: list of the messages describing the endpoints slower than in the baseline
+    """
+    regressions = []
+    for endpoint, stats in sorted(report.items()):
+        base = baseline.get(endpoint)
+        if base is None:
+            continue
+        if stats['p99-ms'] > base['p99-ms'] * (1 + tolerance):
+            regressions.append('%s: p99 %.2fms, was %.2fms' % (endpoint, stats['p99-ms'], base['p99-ms']))
+        if stats['throughput-rps'] < base['throughput-rps'] * (1 - tolerance):
+            regressions.append('%s: %.1f requests/s, was %.1f' %
+                               (endpoint, stats['throughput-rps'], base['throughput-rps']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int, default=5000, help='number of apps created in the uploads directory')
+    parser.add_argument('--files', type=int, default=5, help='number of files in each app')
+    parser.add_argument('--log-lines', type=int, default=1000, help='number of lines in each app log')
+    parser.add_argument('--large-apps', type=int, default=10, help='number of additional apps with a large log')
+    parser.add_argument('--large-log-lines', type=int, default=500000, help='number of lines in the large logs')
+    parser.add_argument('--jars', type=int, default=500, help='number of jars under SPARK_HOME and SPARKTK_HOME')
+    parser.add_argument('--requests', type=int, default=1000, help='number of requests sent to each endpoint')
+    parser.add_argument('--concurrency', type=int, default=100, help='number of concurrent clients')
+    parser.add_argument('--upload-bytes', type=int, default=1024 ** 2, help='size of the jar sent by each /upload')
+    parser.add_argument('--spark-submit-sleep', type=float, default=0, help='seconds each fake spark-submit runs')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help='comma separated endpoints to load, in order, among %s' % ', '.join(ENDPOINTS))
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random choice of the apps')
+    parser.add_argument('--output', help='file where the json report is saved')
+    parser.add_argument('--baseline', help='json report of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    endpoints = args.endpoints.split(',')
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error('unknown endpoints: %s' % ', '.join(sorted(unknown)))
+
+    with Workspace(args.jars, args.spark_submit_sleep):
+        start = time.time()
+        app_dirs = create_apps(args.apps, args.files, args.log_lines)
+        app_dirs += create_apps(args.large_apps, args.files, args.large_log_lines, first=args.apps)
+        setup_s = time.time() - start
+        server = ExtensionServer()
+        requests = Requests(server.url, app_dirs, args.upload_bytes, args.seed)
+        report = IOLoop.current().run_sync(
+            lambda: run(server, requests, endpoints, args.requests, args.concurrency), timeout=3600)
+        server.stop()
+
+    print json.dumps({'setup-s': round(setup_s, 3), 'endpoints': report}, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print >> sys.stderr, 'regression: ' + regression
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+long lived pyspark driver of the sparktk_ext driver pool.
+
+the SparkContext (and a sparktk TkContext when sparktk is installed) is created once, then the uploaded scripts are
+run one after the other inside this process, each in a fresh namespace where sc, sqlContext and tc are already
+defined, so they skip the JVM and context startup of spark-submit.
+
+protocol with sparktk_ext.DriverPool:
+  - the jars, driver class path and master are given through PYSPARK_SUBMIT_ARGS, like for the pyspark shell
+  - stdin receives one json request per line: {"script": <path>, "argv": [<arguments>]}
+  - stdout and stderr are the output of the running script (and of the JVM), appended to the log of its app
+  - messages to the pool are written to the output too, on their own line starting with MESSAGE_PREFIX:
+    {"ready": true|false} once the contexts are created, then {"exit-code": <int>, "alive": <bool>} after each script.
+    The driver exits after a script stopped the SparkContext, and when stdin is closed.
+"""
+import fcntl
+import json
+import os
+import sys
+import traceback
+
+MESSAGE_PREFIX = '\x00sparktk-driver:'
+
+
+def send(message):
+    """
+    writes a message to the pool after the output of the script
+    :param message: dict sent as json
+    :return: None
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.write(2, MESSAGE_PREFIX + json.dumps(message) + '\n')  # a single write, it is not mixed with other output
+
+
+def take_stdin():
+    """
+    keeps the requests of the pool away from the scripts: stdin is replaced by /dev/null
+    :return: file reading the requests of the pool
+    """
+    requests_fd = os.dup(0)
+    fcntl.fcntl(requests_fd, fcntl.F_SETFD, fcntl.fcntl(requests_fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    return os.fdopen(requests_fd, 'r')
+
+
+def create_contexts():
+    """
+    :return: the SparkContext, and the dict of the variables defined for every script
+    """
+    from pyspark import SparkContext
+    from pyspark.sql import SQLContext
+
+    sc = SparkContext(appName='sparktk-warm-driver')
+    variables = {'sc': sc, 'sqlContext': SQLContext(sc)}
+    try:
+        import sparktk
+    except ImportError:
+        return sc, variables
+    try:
+        variables['tc'] = sparktk.TkContext(sc)
+    except Exception:
+        traceback.print_exc()
+        print >> sys.stderr, "sparktk_driver: tc is not available to the scripts"
+    return sc, variables
+
+
+def run_script(script, argv, variables):
+    """
+    runs the script as __main__ in a fresh namespace
+    :param script: path to the script
+    :param argv: the arguments of the script
+    :param variables: dict of the variables defined for the script
+    :return: the exit code of the script
+    """
+    namespace = dict(variables, __name__='__main__', __file__=script, __builtins__=__builtins__)
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    sys.argv = [script] + list(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        with open(script) as f:
+            code = compile(f.read(), script, 'exec')
+        exec code in namespace
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print >> sys.stderr, e.code
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+
+
+def main():
+    requests = take_stdin()
+    try:
+        sc, variables = create_contexts()
+    except Exception:
+        traceback.print_exc()
+        send({'ready': False})
+        return 1
+    send({'ready': True})
+
+    for line in iter(requests.readline, ''):
+        request = json.loads(line)
+        exit_code = run_script(request['script'], request.get('argv', []), variables)
+        alive = sc._jsc is not None  # the script may have stopped the SparkContext
+        send({'exit-code': exit_code, 'alive': alive})
+        if not alive:
+            return 0
+    sc.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,57 +1,458 @@
+import base64
+import bisect
+import cgi
+import collections
+import concurrent.futures
 import errno
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
 import json
 import os
+import pipes
+import Queue
+import re
+import shutil
+import signal
+import sqlite3
+import struct
 import subprocess
+import sys
+import tempfile
+import threading
 import time
+import uuid
 
-from concurrent.futures import ProcessPoolExecutor as Pool
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from notebook.base.handlers import IPythonHandler
+from tornado import gen, httputil
+from tornado.concurrent import Future, run_on_executor
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.log import app_log
+from tornado.web import HTTPError, stream_request_body
+
+import sparktk_driver
 
 STATUS_FILE = 'STATUS.log'
 LOG_FILE = 'LOG.log'
+LOG_INDEX_FILE = 'LOG.log.idx'
+LOG_MANIFEST_FILE = 'LOG.log.manifest'  # the rotated segments of LOG_FILE, named LOG.log.<seq>.gz
 
 APP_STATUS = {
     'UPLOADED': 'uploaded',
     'SUBMITTED': 'submitted',
-    'COMPLETED': 'completed'
+    'COMPLETED': 'completed',
+    'FAILED': 'failed',  # spark-submit returned a non-zero exit code
+    'CANCELLED': 'cancelled',  # the job was cancelled with /cancel
+    'TIMED_OUT': 'timed-out',  # the job ran longer than the timeout given to /spark-submit
+    'SKIPPED': 'skipped'  # a step of a /batch-submit not run because a step it runs after did not complete
 }
 
+# apps in these statuses are no longer used by a job
+FINISHED_STATUSES = [APP_STATUS['COMPLETED'], APP_STATUS['FAILED'], APP_STATUS['CANCELLED'], APP_STATUS['TIMED_OUT'],
+                     APP_STATUS['SKIPPED']]
+
+
+def setting_from_env(name, default, cast=int):
+    """
+    :param name: name of the setting, can be overridden with the SPARKTK_EXT_<name> environment variable
+    :param default: value used when the environment variable is not set
+    :param cast: callable converting the environment variable string to the setting type
+    :return: the value of the setting
+    """
+    value = os.environ.get('SPARKTK_EXT_' + name)
+    if value is None:
+        return default
+    return cast(value)
+
+
 APP_SETTINGS = {
     'TEMPLATE_PATH': r"templates",
     'STATIC_PATH': r"templates/static",
     'UPLOADS_PATH': r"uploads",
-    "XSRF_COOKIES": False
+    "XSRF_COOKIES": False,
+    'MAX_RUNNING_JOBS': setting_from_env('MAX_RUNNING_JOBS', 2),  # number of spark-submit jobs allowed to run at once
+    'CLASSPATH_CACHE_FILE': setting_from_env('CLASSPATH_CACHE_FILE', None, str),  # on disk copy of the jars search
+    'CLASSPATH_MANIFEST': setting_from_env('CLASSPATH_MANIFEST', None, str),  # pinned jars, never searched again
+    'MAX_UPLOAD_BYTES': setting_from_env('MAX_UPLOAD_BYTES', 2 * 1024 ** 3),  # size limit of an /upload request body
+    'MAX_UPLOAD_FILE_BYTES': setting_from_env('MAX_UPLOAD_FILE_BYTES', 1024 ** 3),  # size limit of each uploaded file
+    'LOG_CURSOR_MAX_BYTES': setting_from_env('LOG_CURSOR_MAX_BYTES', 1024 ** 2),  # log bytes returned per /logs?since=
+    'LOG_FOLLOW_INTERVAL_MS': setting_from_env('LOG_FOLLOW_INTERVAL_MS', 500),  # how often followed logs are checked
+    'STATUS_DB': setting_from_env('STATUS_DB', r"uploads/.status.sqlite", str),  # persisted latest status of every app
+    'IO_THREADS': setting_from_env('IO_THREADS', 4),  # threads running the disk work of the handlers off the IOLoop
+    'GC_INTERVAL_S': setting_from_env('GC_INTERVAL_S', 600),  # how often finished apps are checked for removal
+    'RETENTION_MAX_AGE_S': setting_from_env('RETENTION_MAX_AGE_S', None),  # finished apps older than this are removed
+    'RETENTION_MAX_APPS': setting_from_env('RETENTION_MAX_APPS', None),  # finished apps kept, the oldest are removed
+    'RETENTION_MAX_BYTES': setting_from_env('RETENTION_MAX_BYTES', None),  # uploads size above which finished apps go
+    'KILL_GRACE_S': setting_from_env('KILL_GRACE_S', 10),  # seconds between SIGTERM and SIGKILL of a cancelled job
+    'METRICS_DISK_INTERVAL_S': setting_from_env('METRICS_DISK_INTERVAL_S', 60),  # seconds between two disk usage scans
+    'LOG_SEGMENT_BYTES': setting_from_env('LOG_SEGMENT_BYTES', 64 * 1024 ** 2),  # size at which an app log is rotated
+    'LOG_MAX_APP_BYTES': setting_from_env('LOG_MAX_APP_BYTES', None),  # disk space above which old log segments go
+    'LOG_TAIL_LINES': setting_from_env('LOG_TAIL_LINES', 1000),  # latest lines of a running job kept in memory
+    'DRIVER_POOL_SIZE': setting_from_env('DRIVER_POOL_SIZE', 0),  # pyspark drivers started for mode=warm, 0 disables
+    'DRIVER_MAX_JOBS': setting_from_env('DRIVER_MAX_JOBS', 20),  # jobs run by a warm driver before it is replaced
+    'DRIVER_MASTER': setting_from_env('DRIVER_MASTER', None, str),  # master of the warm drivers, e.g. local[*]
+    'DRIVER_START_TIMEOUT_S': setting_from_env('DRIVER_START_TIMEOUT_S', 300),  # seconds given to a driver to start
+    'DEDUPLICATE_UPLOADS': setting_from_env('DEDUPLICATE_UPLOADS', 1),  # store uploaded content once, 0 disables
+    'BLOBS_PATH': setting_from_env('BLOBS_PATH', r"uploads/.blobs", str),  # content store, on the uploads file system
+    'LOG_SEARCH_THREADS': setting_from_env('LOG_SEARCH_THREADS', 2),  # threads running /logs/search, apart from io ones
+    'BATCHES_KEPT': setting_from_env('BATCHES_KEPT', 1000),  # finished /batch-submit batches kept for /batch-status
+    'SUBMIT_CACHE_PATH': setting_from_env('SUBMIT_CACHE_PATH', r"uploads/.submit-cache", str),  # results of cache=true
+    'SUBMIT_CACHE_MAX_BYTES': setting_from_env('SUBMIT_CACHE_MAX_BYTES', 1024 ** 3)  # disk space of the cached logs
 }
 
 RESPONSE = {
     "DRIVER_PATH": 'driver-path',  # submitted app id
-    "APP_STATUS": 'app-status',  # UPLOADED, SUBMITTED, COMPLETED
+    "APP_STATUS": 'app-status',  # UPLOADED, SUBMITTED, COMPLETED, FAILED
     "APP_DIR": 'app-dir',  # Path where the app bits are uploaded
-    "LAST_UPDATED": "last-updated"  # The time and date of last status update
+    "LAST_UPDATED": "last-updated",  # The time and date of last status update
+    "QUEUE_POSITION": "queue-position",  # 1-based position of a SUBMITTED app still waiting for a free job slot
+    "CHECKSUM": "sha256",  # checksum of an uploaded file
+    "LOG_CONTENT": "content",  # log lines returned by /logs when reading from a byte cursor
+    "NEXT_CURSOR": "next-cursor",  # byte cursor to pass as "since" to /logs to get the lines written after content
+    "LOG_FINISHED": "finished",  # true once the app is not running and its whole log was returned
+    "APPS": "apps",  # list of app statuses returned by /apps
+    "CREATED_AT": "created-at",  # seconds since epoch when the app got its first status
+    "UPDATED_AT": "updated-at",  # seconds since epoch of the last status update
+    "LOG_SIZE": "log-size",  # size in bytes of the app log
+    "EXIT_CODE": "exit-code",  # exit code of spark-submit, negative when it was killed by a signal
+    "QUEUE_WAIT": "queue-wait-s",  # seconds the job waited in the scheduler queue
+    "RUN_DURATION": "run-duration-s",  # wall clock seconds spark-submit ran
+    "CPU_USER": "cpu-user-s",  # user CPU seconds of spark-submit and the processes it waited for
+    "CPU_SYSTEM": "cpu-system-s",  # system CPU seconds of spark-submit and the processes it waited for
+    "PEAK_RSS": "peak-rss-bytes",  # largest resident set size of spark-submit and the processes it waited for
+    "MATCHES": "matches",  # log lines found by /logs/search
+    "LINE_NUMBER": "line",  # 0-based number of a log line, usable as the offset of /logs
+    "LINE": "text",  # content of a log line
+    "CONTEXT_BEFORE": "before",  # lines preceding a log line found by /logs/search
+    "CONTEXT_AFTER": "after",  # lines following a log line found by /logs/search
+    "TRUNCATED": "truncated",  # true when more lines matched than the ones returned
+    "ERROR": "error",  # why an app of a multi-app request has no result
+    "BATCH_ID": "batch-id",  # id of a batch of dependent apps submitted by /batch-submit
+    "BATCH_STATUS": "batch-status",  # SUBMITTED until every step finished, then COMPLETED, FAILED or CANCELLED
+    "STEPS": "steps",  # statuses of the apps of a batch
+    "CACHED_FROM": "cached-from"  # app whose successful run was reused by a cache=true /spark-submit
 }
 
 
-def update_status(driver_path, app_status=APP_STATUS['COMPLETED']):
+def update_status(driver_path, app_status=APP_STATUS['COMPLETED'], details=None):
     """
     :param driver_path: path to the main sparktk/pyspark script in the uploads directory
     :param app_status: final status of the app after this update written to STATUS_FILE
-    :return: handler to the updated STATUS_FILE
+    :param details: optional dict of extra RESPONSE entries recorded with this update
+    :return: the status entry written to STATUS_FILE, as a dict
     """
     app_dir = os.path.dirname(driver_path)
+    status = dict(details or {})
+    status.update({
+        RESPONSE['DRIVER_PATH']: driver_path,
+        RESPONSE['APP_STATUS']: app_status,
+        RESPONSE['APP_DIR']: app_dir,
+        RESPONSE['LAST_UPDATED']: time.strftime("%c")
+    })
     status_file = open(os.path.dirname(driver_path) + '/' + STATUS_FILE, 'a+w')
     status_file.write('\n')
-    status_file.write(json.dumps(
-        dict(
-            {
-                RESPONSE['DRIVER_PATH']: driver_path,
-                RESPONSE['APP_STATUS']: app_status,
-                RESPONSE['APP_DIR']: app_dir,
-                RESPONSE['LAST_UPDATED']: time.strftime("%c")
-            }
-        )
-    ))
+    status_file.write(json.dumps(status))
     status_file.close()
-    return status_file
+    return status
+
+
+class StatusRegistry(object):
+    """
+    latest status of every app, indexed in memory by app directory and persisted in a sqlite database,
+    so looking up the status of an app never reads its STATUS_FILE, and the index survives restarts.
+    every update is still appended to the STATUS_FILE of the app for backward compatibility.
+    apps uploaded before the registry existed are imported from their STATUS_FILE the first time they are looked up.
+    the registry is loaded when the server starts, before any job runs: the apps it finds SUBMITTED were left so by the
+    previous server and no job will ever finish them, they are marked FAILED.
+    """
+
+    def __init__(self, db_path=APP_SETTINGS['STATUS_DB'], log=app_log):
+        self.log = log
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS apps ("
+                         "app_dir TEXT PRIMARY KEY, status TEXT, created_at REAL, updated_at REAL, record TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS apps_by_update ON apps (updated_at, app_dir)")
+        self._db.commit()
+        self._latest = {}
+        for app_dir, record in self._db.execute("SELECT app_dir, record FROM apps"):
+            self._latest[app_dir] = json.loads(record)
+        for app_dir, record in self._latest.items():
+            if record.get(RESPONSE['APP_STATUS']) == APP_STATUS['SUBMITTED']:
+                self._fail_interrupted(app_dir, record)
+
+    def get(self, app_dir):
+        """
+        :param app_dir: the app directory
+        :return: the latest status entry of the app as a dict, None if the app has no status
+        """
+        key = os.path.normpath(app_dir)
+        with self._lock:
+            record = self._latest.get(key)
+            if record is None:
+                record = self._import(key)
+            return dict(record) if record is not None else None
+
+    def import_apps(self, uploads_path):
+        """
+        imports the apps of uploads_path that are not in the registry yet, so they show up in listings
+        :param uploads_path: the directory containing the app directories
+        :return: None
+        """
+        if not os.path.isdir(uploads_path):
+            return
+        for name in os.listdir(uploads_path):
+            if not name.startswith('.'):  # the status db and the blob store
+                self.get(uploads_path + '/' + name)
+
+    def list(self, app_dirs=None, statuses=None, limit=100, cursor=None, ascending=False):
+        """
+        :param app_dirs: optional list of the app directories to return
+        :param statuses: optional list of the statuses of the apps to return
+        :param limit: maximum number of apps returned
+        :param cursor: the next cursor returned by the previous call, to get the following apps
+        :param ascending: oldest updates first instead of most recent first
+        :return: list of (status entry, created_at, updated_at) ordered by last update, and the cursor of the next page
+                 (None on the last page)
+        """
+        if app_dirs is not None:
+            app_dirs = [os.path.normpath(app_dir) for app_dir in app_dirs]
+            for app_dir in app_dirs:
+                self.get(app_dir)
+        conditions, params = [], []
+        if app_dirs is not None:
+            conditions.append("app_dir IN (%s)" % ','.join('?' * len(app_dirs)))
+            params.extend(app_dirs)
+        if statuses is not None:
+            conditions.append("status IN (%s)" % ','.join('?' * len(statuses)))
+            params.extend(statuses)
+        if cursor is not None:
+            updated_at, app_dir = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            operator = '>' if ascending else '<'
+            conditions.append("(updated_at %s ? OR (updated_at = ? AND app_dir %s ?))" % (operator, operator))
+            params.extend([updated_at, updated_at, app_dir])
+        query = "SELECT app_dir, created_at, updated_at, record FROM apps"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        order = "ASC" if ascending else "DESC"
+        query += " ORDER BY updated_at %s, app_dir %s LIMIT ?" % (order, order)
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = base64.urlsafe_b64encode(json.dumps([rows[-1][2], rows[-1][0]]))
+        return [(json.loads(record), created_at, updated_at) for app_dir, created_at, updated_at, record in rows], \
+            next_cursor
+
+    def update(self, driver_path, app_status, details=None, allowed=None):
+        """
+        records a new status for the app of driver_path
+        :param driver_path: the path to the main sparktk/pyspark script within the uploads folder
+        :param app_status: the new status of the app
+        :param details: optional dict of extra RESPONSE entries recorded with this update
+        :param allowed: optional list of the statuses the app may be in for this update to happen
+        :return: the new status entry as a dict, None if the app was not in one of the allowed statuses
+        """
+        key = os.path.normpath(os.path.dirname(driver_path))
+        with self._lock:
+            current = self._latest.get(key) or self._import(key)
+            if allowed is not None and (current or {}).get(RESPONSE['APP_STATUS']) not in allowed:
+                return None
+            record = update_status(driver_path, app_status=app_status, details=details)
+            self._save(key, record)
+            return dict(record)
+
+    def rename(self, app_dir, dst_dir):
+        """
+        moves the app directory, unless the app is SUBMITTED
+        :return: True if the app was moved
+        """
+        key, dst_key = os.path.normpath(app_dir), os.path.normpath(dst_dir)
+        with self._lock:
+            record = self._latest.get(key) or self._import(key)
+            if record is not None and record[RESPONSE['APP_STATUS']] == APP_STATUS['SUBMITTED']:
+                return False
+            os.rename(app_dir, dst_dir)
+            if record is not None:
+                record = dict(record)
+                record[RESPONSE['APP_DIR']] = dst_dir
+                record[RESPONSE['DRIVER_PATH']] = dst_dir + '/' + os.path.basename(record[RESPONSE['DRIVER_PATH']])
+                with self._db:
+                    self._db.execute("DELETE FROM apps WHERE app_dir = ?", (key,))
+                self._latest.pop(key, None)
+                self._save(dst_key, record)
+            return True
+
+    def remove(self, app_dir):
+        """
+        forgets the app, unless it is SUBMITTED. The caller deletes the app directory.
+        :return: True if the app was removed
+        """
+        key = os.path.normpath(app_dir)
+        with self._lock:
+            record = self._latest.get(key) or self._import(key)
+            if record is not None and record[RESPONSE['APP_STATUS']] == APP_STATUS['SUBMITTED']:
+                return False
+            with self._db:
+                self._db.execute("DELETE FROM apps WHERE app_dir = ?", (key,))
+            self._latest.pop(key, None)
+            return True
+
+    def _save(self, key, record):
+        now = time.time()
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO apps (app_dir, created_at) VALUES (?, ?)", (key, now))
+            self._db.execute("UPDATE apps SET status = ?, updated_at = ?, record = ? WHERE app_dir = ?",
+                             (record[RESPONSE['APP_STATUS']], now, json.dumps(record), key))
+        self._latest[key] = record
+
+    def _import(self, key):
+        status_file = key + '/' + STATUS_FILE
+        if not os.path.isfile(status_file):
+            return None
+        with open(status_file, 'rb') as f:
+            lines = f.readlines()
+        for line in reversed(lines):  # the last entry, a blank or truncated last line is skipped
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                if record.get(RESPONSE['APP_STATUS']) == APP_STATUS['SUBMITTED']:
+                    return self._fail_interrupted(key, record)  # submitted ones are recorded in the db first
+                self._save(key, record)
+                return record
+        self.log.warning("sparktk_ext: %s has no valid status entry, the app is ignored" % status_file)
+        return None
+
+    def _fail_interrupted(self, key, record):
+        self.log.warning("sparktk_ext: %s was submitted when the server stopped, it is marked failed" % key)
+        details = {RESPONSE['ERROR']: "the server stopped before the job finished"}
+        try:
+            record = update_status(record[RESPONSE['DRIVER_PATH']], APP_STATUS['FAILED'], details=details)
+        except (IOError, OSError, KeyError):  # the app directory is gone, only the registry is updated
+            record = dict(record, **details)
+            record[RESPONSE['APP_STATUS']] = APP_STATUS['FAILED']
+        self._save(key, record)
+        return record
+
+
+class UploadDirAllocator(object):
+    """
+    hands out the "uploads/dddd" app directories.
+    the next free number is kept in memory (the uploads directory is only listed once), so each new directory costs
+    a single mkdir. The mkdir is also the claim: when it fails because the directory exists the next number is tried,
+    so concurrent uploads never share a directory. Numbers keep growing past 9999 ("uploads/10000").
+    """
+
+    min_digits = len('0000')
+
+    def __init__(self, uploads_path=APP_SETTINGS['UPLOADS_PATH']):
+        self.uploads_path = uploads_path
+        self._lock = threading.Lock()
+        self._next_number = None
+
+    def allocate(self):
+        """
+        :return: name of the newly created app directory
+        """
+        with self._lock:
+            if self._next_number is None:
+                self._next_number = self._first_free_number()
+            while True:
+                dir_name = self.uploads_path + '/%s' % str(self._next_number).zfill(self.min_digits)
+                self._next_number += 1
+                try:
+                    os.mkdir(dir_name)
+                    return dir_name
+                except OSError as exc:
+                    if exc.errno != errno.EEXIST:
+                        raise Exception("Directory creation failed.\n")
+
+    def _first_free_number(self):
+        try:
+            os.makedirs(self.uploads_path)
+        except OSError as exc:
+            if not (exc.errno == errno.EEXIST and os.path.isdir(self.uploads_path)):
+                raise Exception("Directory creation failed.\n")
+        numbers = [int(name) for name in os.listdir(self.uploads_path) if name.isdigit()]
+        return max(numbers) + 1 if numbers else 0
+
+
+class SparkTKHandler(IPythonHandler):
+    """
+    base class for the REST api endpoints that need the shared state of the extension.
+    disk work is done by methods decorated with @run_on_executor(executor='io_pool'), so it runs on the bounded
+    thread pool shared by the handlers instead of blocking the IOLoop.
+    """
+
+    @property
+    def io_pool(self):
+        return self.settings['sparktk_io_pool']
+
+    @property
+    def scheduler(self):
+        return self.settings['sparktk_scheduler']
+
+    @property
+    def registry(self):
+        return self.settings['sparktk_registry']
+
+    @property
+    def classpath(self):
+        return self.settings['sparktk_classpath']
+
+    @property
+    def upload_dirs(self):
+        return self.settings['sparktk_upload_dirs']
+
+    @property
+    def submit_cache(self):
+        return self.settings['sparktk_submit_cache']
+
+    @property
+    def batches(self):
+        return self.settings['sparktk_batches']
+
+    @property
+    def search_pool(self):
+        return self.settings['sparktk_search_pool']
+
+    @property
+    def log_indexes(self):
+        return self.settings['sparktk_log_indexes']
+
+    @property
+    def log_watchers(self):
+        return self.settings['sparktk_log_watchers']
+
+    @property
+    def metrics(self):
+        return self.settings['sparktk_metrics']
+
+    @property
+    def blob_store(self):
+        return self.settings['sparktk_blob_store']
+
+    @property
+    def driver_pool(self):
+        return self.settings['sparktk_driver_pool']
+
+    def on_finish(self):
+        self.metrics.observe_request(self.request.path, self.request.method, self.get_status(),
+                                     self.request.request_time())
 
 
 class IndexHandler(IPythonHandler):
@@ -74,11 +475,238 @@ class UploadFormHandler(IPythonHandler):
         self.render("templates/fileuploadform.html")
 
 
-class UploadHandler(IPythonHandler):
+class MultipartStreamParser(object):
+    """
+    incremental parser for multipart/form-data request bodies.
+    the body of each part is handed to the writer returned by part_begin(headers) as soon as it arrives,
+    so only about one chunk of the request is held in memory no matter how large the parts are.
+    part_begin may return None to skip a part.
+    """
+
+    max_headers_size = 64 * 1024
+
+    def __init__(self, boundary, part_begin):
+        self._delimiter = b'\r\n--' + boundary
+        self._buffer = b'\r\n'  # lets the first boundary match the same delimiter as the others
+        self._part_begin = part_begin
+        self._writer = None
+        self._in_body = False
+        self._in_headers = False
+        self.done = False
+
+    def feed(self, data):
+        self._buffer += data
+        while not self.done:
+            if self._in_headers:
+                index = self._buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(self._buffer) > self.max_headers_size:
+                        raise HTTPError(400, "multipart part headers are too large")
+                    return
+                headers = httputil.HTTPHeaders.parse(self._buffer[:index].decode('utf-8'))
+                self._buffer = self._buffer[index + 4:]
+                self._writer = self._part_begin(headers)
+                self._in_headers = False
+                self._in_body = True
+                continue
+
+            index = self._buffer.find(self._delimiter)
+            end = index + len(self._delimiter)
+            if index < 0 or len(self._buffer) < end + 2:
+                # hold back what could be the start of a delimiter split across two chunks
+                keep = len(self._delimiter) + 2
+                if len(self._buffer) > keep:
+                    self._write(self._buffer[:-keep])
+                    self._buffer = self._buffer[-keep:]
+                return
+            self._write(self._buffer[:index])
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._in_body = False
+            if self._buffer[end:end + 2] == b'--':
+                self.done = True
+                self._buffer = b''
+            else:
+                self._buffer = self._buffer[end + 2:]  # skips the CRLF after the boundary
+                self._in_headers = True
+
+    def _write(self, data):
+        if data and self._in_body and self._writer is not None:
+            self._writer.write(data)
+
+
+class BlobStore(object):
+    """
+    content addressed store of the uploaded files: each distinct content is kept once, in <path>/ab/<sha256>, and
+    the app directories get hard links to it.
+    an upload is written to a temporary file of the store while its sha256 is computed, then either becomes the blob
+    of new content, or is deleted when the content is already stored (usually before the kernel wrote it back to disk).
+    blobs are read only, so an app can't change the files of the other apps sharing them. When an app file can't be
+    linked (another file system, too many links) the app keeps its own copy. detach() gives an app file its own
+    writable copy before it is edited, see detach_before_save.
+    collect() removes the blobs no app links to anymore.
+    """
+
+    TEMP_DIR = 'tmp'
+    TEMP_MAX_AGE_S = 24 * 3600  # temporary files older than this were left by a crash
+
+    def __init__(self, path=APP_SETTINGS['BLOBS_PATH']):
+        self.path = path
+        self.temp_path = os.path.join(path, self.TEMP_DIR)
+        if not os.path.isdir(self.temp_path):
+            os.makedirs(self.temp_path)
+
+    def blob_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    def create_temp(self):
+        """
+        :return: the path and the file object of a new temporary file of the store
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_path)
+        return temp_path, os.fdopen(fd, 'wb')
+
+    def add(self, temp_path, digest, dst_path):
+        """
+        moves a temporary file to the store and links dst_path to the blob of its content
+        :param temp_path: path returned by create_temp, the file is closed
+        :param digest: the sha256 of the file
+        :param dst_path: path of the file in the app directory, replaced if it exists
+        :return: True when the content was already stored
+        """
+        blob_path = self.blob_path(digest)
+        os.chmod(temp_path, 0444)
+        if os.path.lexists(dst_path):
+            os.remove(dst_path)
+        try:
+            os.link(blob_path, dst_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                shutil.move(temp_path, dst_path)  # the blob can't be linked to, the app keeps its own copy
+                return False
+        else:
+            os.remove(temp_path)
+            return True
+        # new content: the app links to it before it is in the store, so collect() never sees it unused
+        try:
+            os.link(temp_path, dst_path)
+        except OSError:
+            shutil.move(temp_path, dst_path)
+            return False
+        try:
+            os.makedirs(os.path.dirname(blob_path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        os.rename(temp_path, blob_path)
+        return False
+
+    def detach(self, path):
+        """
+        replaces a link to a blob by a writable copy of its content, so writing the file leaves the blob unchanged
+        :param path: path of a file of an app directory
+        :return: True when the file was linked to a blob
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_nlink == 1:
+            return False
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(functools.partial(f.read, 1024 ** 2), b''):
+                sha256.update(block)
+        try:
+            blob_stat = os.stat(self.blob_path(sha256.hexdigest()))
+        except OSError:
+            return False
+        if (blob_stat.st_dev, blob_stat.st_ino) != (stat.st_dev, stat.st_ino):
+            return False  # linked to something else, left alone
+        temp_path = path + '.tmp'
+        shutil.copyfile(path, temp_path)  # created with the default mode, writable
+        os.rename(temp_path, path)
+        return True
+
+    def collect(self):
+        """
+        removes the blobs without any app linking to them, and the temporary files left by a crash
+        :return: the number of blobs removed and the number of bytes reclaimed
+        """
+        removed, reclaimed = 0, 0
+        for prefix in os.listdir(self.path):
+            prefix_path = os.path.join(self.path, prefix)
+            if prefix == self.TEMP_DIR or not os.path.isdir(prefix_path):
+                continue
+            for digest in os.listdir(prefix_path):
+                blob_path = os.path.join(prefix_path, digest)
+                stat = os.lstat(blob_path)
+                if stat.st_nlink == 1:
+                    os.remove(blob_path)
+                    removed += 1
+                    reclaimed += stat.st_size
+        oldest_kept = time.time() - self.TEMP_MAX_AGE_S
+        for name in os.listdir(self.temp_path):
+            temp_path = os.path.join(self.temp_path, name)
+            stat = os.lstat(temp_path)
+            if stat.st_mtime < oldest_kept:
+                os.remove(temp_path)
+                reclaimed += stat.st_size
+        return removed, reclaimed
+
+
+class UploadedFile(object):
+    """
+    writes an uploaded file to disk while it is received, enforcing max_size and computing its sha256.
+    with a blob_store the file is written to the store, and linked to path once complete
+    """
+
+    def __init__(self, path, max_size, blob_store=None):
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.blob_store = blob_store
+        self._sha256 = hashlib.sha256()
+        if blob_store is None:
+            self._temp_path, self._file = None, open(path, 'wb')
+        else:
+            self._temp_path, self._file = blob_store.create_temp()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise HTTPError(413, "%s is larger than the %d bytes allowed per file" %
+                            (os.path.basename(self.path), self.max_size))
+        self._sha256.update(data)
+        self._file.write(data)
+
+    def close(self):
+        """the file is complete"""
+        self._file.close()
+        if self._temp_path is not None:
+            self.blob_store.add(self._temp_path, self.checksum(), self.path)
+            self._temp_path = None
+
+    def discard(self):
+        """removes what was written of the file"""
+        self._file.close()
+        for path in (self._temp_path, self.path):
+            if path is not None and os.path.lexists(path):
+                os.remove(path)
+        self._temp_path = None
+
+    def checksum(self):
+        return self._sha256.hexdigest()
+
+
+@stream_request_body
+class UploadHandler(SparkTKHandler):
     """
     implements the "upload" REST api endpoint.
     currently the only way to upload files to Jupyter is using the upload Form.
     after each attemp to upload the file(s) are loaded into a directory format like "uploads/dddd" where d is a digit.
+    the request body is streamed to disk while it is received, and the sha256 of each file is returned in its status.
 
     Examples:
         curl http://<JUPYTER_NOTEBOOK_URL>/upload -F "filearg=@/home/ashahba/frame-basics.py"
@@ -88,223 +716,2809 @@ class UploadHandler(IPythonHandler):
         """
         :return: name of the directory created that contains uploaded script(s), jars
         """
-        max_dir_len = len('0000')
-        i = 0
-        dir_name = APP_SETTINGS['UPLOADS_PATH'] + '/%s' % str(i).zfill(max_dir_len)
-        while os.path.exists(dir_name) and (i < 10 ** max_dir_len):
-            i += 1
-            dir_name = APP_SETTINGS['UPLOADS_PATH'] + '/%s' % str(i).zfill(max_dir_len)
+        return self.upload_dirs.allocate()
+
+    def prepare(self):
+        self.app_dir = None
+        self.uploaded_files = []
+        self.upload_error = None
+        self.parser = None
+        self.pending_write = None
+        if self.request.method != 'POST':
+            return
+        content_length = self.request.headers.get('Content-Length')
+        if content_length is not None and content_length.isdigit() and \
+                int(content_length) > APP_SETTINGS['MAX_UPLOAD_BYTES']:
+            # answered before the body is read, a chunked body going over the limit resets the connection instead
+            raise HTTPError(413, "the upload is larger than the %d bytes allowed" % APP_SETTINGS['MAX_UPLOAD_BYTES'])
+        self.request.connection.set_max_body_size(APP_SETTINGS['MAX_UPLOAD_BYTES'])
+        content_type, params = cgi.parse_header(self.request.headers.get('Content-Type', ''))
+        if content_type != 'multipart/form-data' or not params.get('boundary'):
+            raise HTTPError(400, "uploads must be sent as multipart/form-data")
+        self.parser = MultipartStreamParser(params['boundary'].encode('utf-8'), self.part_begin)
+
+    def part_begin(self, headers):
+        disposition, params = cgi.parse_header(headers.get('Content-Disposition', ''))
+        if params.get('name') != 'filearg' or not params.get('filename'):
+            return None
+        if self.app_dir is None:
+            self.app_dir = self.create_upload_dir()
+        uploaded_file = UploadedFile(self.app_dir + '/' + os.path.basename(params['filename']),
+                                     APP_SETTINGS['MAX_UPLOAD_FILE_BYTES'], self.blob_store)
+        self.uploaded_files.append(uploaded_file)
+        return uploaded_file
 
-        if (i >= 10 ** max_dir_len):
-            raise Exception("Too many uploads have been done!\nPlease run some cleanup before uploading more files.\n")
+    @gen.coroutine
+    def data_received(self, chunk):
+        if self.upload_error is not None:
+            return  # the rest of the body is dropped, the error is returned once it has been received
+        self.pending_write = self.write_chunk(chunk)
+        yield self.pending_write
 
+    @run_on_executor(executor='io_pool')
+    def write_chunk(self, chunk):
         try:
-            os.makedirs(dir_name)
-        except OSError as exc:
-            if exc.errno == errno.EEXIST and os.path.isdir(dir_name):
-                pass
+            self.parser.feed(chunk)
+        except HTTPError as e:
+            self.upload_error = e
+            self.discard_upload()
+
+    def on_connection_close(self):
+        if self.parser is not None and not self.parser.done:
+            if self.pending_write is None:
+                self.io_pool.submit(self.discard_upload)
             else:
-                raise Exception("Directory creation failed.\n")
+                # the chunk being written is finished before the files are removed
+                IOLoop.current().add_future(self.pending_write, lambda future: self.io_pool.submit(self.discard_upload))
 
-        return dir_name
+    def discard_upload(self):
+        """removes what was written so far of an upload that failed"""
+        for uploaded_file in self.uploaded_files:
+            uploaded_file.discard()
+        if self.app_dir is not None and os.path.isdir(self.app_dir):
+            os.rmdir(self.app_dir)
+        self.app_dir = None
+        self.uploaded_files = []
 
+    @gen.coroutine
     def post(self):
-        app_dir = self.create_upload_dir()
-        for filearg in self.request.files['filearg']:
-            original_fname = filearg['filename']
-            output_file = open(app_dir + '/' + original_fname, 'w')
-            output_file.write(filearg['body'])
-            driver_path = app_dir + '/' + original_fname
+        if self.upload_error is not None:
+            raise self.upload_error
+        if not self.parser.done:
+            yield self.io_pool.submit(self.discard_upload)
+            raise HTTPError(400, "incomplete multipart/form-data body")
+        if not self.uploaded_files:
+            raise HTTPError(400, "no filearg was uploaded")
+        self.write((yield self.record_uploads()))
+        self.metrics.observe_upload(len(self.uploaded_files),
+                                    sum(uploaded_file.size for uploaded_file in self.uploaded_files))
 
-            status_file = update_status(driver_path, app_status=APP_STATUS['UPLOADED'])
-            with open(status_file.name, 'rb') as f:
-                self.write(f.readlines()[-1])
-            f.close()
+    @run_on_executor(executor='io_pool')
+    def record_uploads(self):
+        return ''.join(json.dumps(self.registry.update(uploaded_file.path, APP_STATUS['UPLOADED'],
+                                                       details={RESPONSE['CHECKSUM']: uploaded_file.checksum()}))
+                       for uploaded_file in self.uploaded_files)
 
 
-def mark_submitted(driver_path):
+def mark_submitted(registry, driver_path):
     """
     updates the STATUS_FILE with a new entry when job is submitted
+    :param registry: the StatusRegistry of the extension
     :param driver_path: the path to the main sparktk/pyspark script within the uploads folder
     :return: None
     """
-    update_status(driver_path, app_status=APP_STATUS['SUBMITTED'])
+    registry.update(driver_path, APP_STATUS['SUBMITTED'])
 
 
-def spark_submit(exec_string, log_file, driver_path):
+class RecentLines(object):
     """
-    asynchronously run the pyspark/sparktk submitted script while writing the logs to the log_file for the app
-    :param exec_string: the command that is going to be run
-    :param log_file: the file containing command(script) logs while running
-    :param driver_path: the path to the main sparktk/pyspark script within the uploads folder
-    :return: None
+    bounded in-memory tail of the output of a running job, fed by its output pump right after each write to the log,
+    so the last lines of active jobs are served without reading the log.
+    an unterminated last line longer than max_partial is not kept; tail() gives up until the line is complete.
     """
-    print "Entering spark_submit"
-    mark_submitted(driver_path)
-    pool = Pool(max_workers=1)
-    cmd_string = "%s >>%s 2>&1" % (exec_string, log_file)
-    print "CMD stting is %s" % (cmd_string)
-    future = pool.submit(subprocess.call, cmd_string, shell=True)
-    future.driver_path = driver_path
-    future.add_done_callback(mark_completed)
 
+    max_partial = 1024 ** 2
 
-def mark_completed(future):
-    """
-    once the application has finished running, updates the status_file with a new entry for COMPLETED
-    :param future:
-    :return: None
-    """
-    update_status(future.driver_path, app_status=APP_STATUS['COMPLETED'])
+    def __init__(self, max_lines=APP_SETTINGS['LOG_TAIL_LINES'], complete=False):
+        """
+        :param max_lines: number of complete lines kept
+        :param complete: whether the log was empty when the job started, then all its lines are known until
+                         max_lines is exceeded
+        """
+        self.complete = complete
+        self._lines = collections.deque(maxlen=max_lines)
+        self._partial = b''  # the unterminated last line, None once it is too long to be kept
+        self._lock = threading.Lock()
+
+    def feed(self, data):
+        parts = data.split('\n')
+        with self._lock:
+            if len(parts) > 1:
+                if self._partial is None:
+                    del parts[0]  # the end of a line that was not kept, the lines before it are useless too
+                    self._lines.clear()
+                    self.complete = False
+                else:
+                    parts[0] = self._partial + parts[0]
+                if len(self._lines) + len(parts) - 1 > self._lines.maxlen:
+                    self.complete = False
+                self._lines.extend(part + '\n' for part in parts[:-1])
+                self._partial = parts[-1]
+            elif self._partial is not None:
+                self._partial += parts[0]
+            if self._partial is not None and len(self._partial) > self.max_partial:
+                self._partial = None
 
+    def tail(self, count, num_lines):
+        """
+        :param count: number of lines from the end of the log
+        :param num_lines: maximum number of lines returned, all of them when negative
+        :return: list of the lines like AppLog.tail, None if they are not all in memory
+        """
+        with self._lock:
+            if self._partial is None:
+                return None
+            lines = list(self._lines)
+            if self._partial:
+                lines.append(self._partial)
+        if count > len(lines) and not self.complete:
+            return None
+        lines = lines[max(len(lines) - count, 0):]
+        return lines[:num_lines] if num_lines >= 0 else lines
 
-# TODO: this is only a workaround to ublock the spark-submit against sparktk apps while the bug is being fixed.
-def get_sparktk_submit_jars():
+
+class SparkSubmitJob(object):
     """
-    spark-submit requires sparktk apps to provide values for both --jars and --driver-class-path options.
-    This function finds these jars.
-    :return: a list of strings and a string to be used for --jars and --driver-class-path command line option values
+    a single spark-submit run of an uploaded app, executed by the JobScheduler.
+    the command runs in its own process group, so terminate() stops spark-submit together with everything it started.
+    its output is pumped to the log of the app and to recent_lines.
     """
-    extns = ('.jar')
-    sparktk_submit_jars = []
 
-    for root, dirnames, fns in os.walk(os.environ['SPARK_HOME']):
-        sparktk_submit_jars.extend(os.path.join(root, fn) for fn in fns if fn.lower().endswith(extns))
-    for root, dirnames, fns in os.walk(os.environ['SPARKTK_HOME']):
-        sparktk_submit_jars.extend(os.path.join(root, fn) for fn in fns if fn.lower().endswith(extns))
-    sparktk_driver_class_path = \
-        os.environ['SPARK_HOME'] + \
-        "/lib/*:" + os.environ['SPARKTK_HOME'] \
-        + "/*:" + os.environ['SPARKTK_HOME'] + \
-        "/dependencies/*"
+    def __init__(self, argv, log_file, driver_path, timeout=None):
+        self.argv = argv
+        self.log_file = log_file
+        self.driver_path = driver_path
+        self.app_dir = os.path.dirname(driver_path)
+        self.timeout = timeout
+        self.queued_at = time.time()
+        self.cancel_status = None  # CANCELLED or TIMED_OUT once the job is terminated
+        self.recent_lines = None  # RecentLines of the output, once the job started
+        self.on_finished = None  # optional function called with the final app status of the job
+        self._process = None
+        self._killer = None
+        self._lock = threading.Lock()
 
-    return ','.join(sparktk_submit_jars), sparktk_driver_class_path
+    def run(self):
+        """
+        runs the job while appending its output to the log_file of the app through a RotatingLogWriter
+        :return: dict of the RESPONSE entries accounting for the run: exit code, queue wait, run duration,
+                 CPU times and peak memory. Empty if the job was cancelled before it started.
+        """
+        started_at = time.time()
+        writer = RotatingLogWriter(os.path.dirname(self.log_file))
+        try:
+            recent_lines = RecentLines(complete=writer.size == 0 and writer.manifest['next-seq'] == 1)
 
+            def output(data):
+                writer.write(data)
+                recent_lines.feed(data)
 
-class SparkSubmitHandler(IPythonHandler):
-    """
-    implements the "spark-submit" REST api end point
+            accounting = self._execute(output, recent_lines)
+        finally:
+            writer.close()
+        with self._lock:
+            if self._killer is not None:
+                self._killer.cancel()
+        if accounting:
+            accounting[RESPONSE['QUEUE_WAIT']] = round(started_at - self.queued_at, 3)
+            accounting[RESPONSE['RUN_DURATION']] = round(time.time() - started_at, 3)
+        return accounting
 
-    Examples:
-        curl http://<JUPYTER_NOTEBOOK_URL>/spark-submit -d "driver-path=uploads/0001/frame-basics.py"
-    """
+    def _execute(self, output, recent_lines):
+        """
+        runs spark-submit in its own process group
+        :param output: function called with each chunk of the output
+        :param recent_lines: the RecentLines fed by output, published once the job started
+        :return: dict of the exit code, CPU times and peak memory of the run, empty if the job was cancelled
+        """
+        app_log.debug("sparktk_ext: running %s" % ' '.join(self.argv))
+        with self._lock:
+            if self.cancel_status is not None:
+                return {}
+            try:
+                process = self._process = subprocess.Popen(self.argv, stdout=subprocess.PIPE,
+                                                           stderr=subprocess.STDOUT, close_fds=True,
+                                                           preexec_fn=os.setsid)
+            except OSError as e:
+                output("%s: %s\n" % (self.argv[0], e.strerror))
+                raise
+            self.recent_lines = recent_lines
+        try:
+            stdout = process.stdout.fileno()
+            while True:
+                data = os.read(stdout, 64 * 1024)
+                if not data:
+                    break
+                output(data)
+        finally:
+            process.stdout.close()  # if writing failed, the job gets SIGPIPE rather than blocking on a full pipe
+        # wait4 rather than wait: the rusage covers spark-submit and every process of the tree it waited for
+        pid, exit_status, rusage = os.wait4(process.pid, 0)
+        process.returncode = exit_code = \
+            -os.WTERMSIG(exit_status) if os.WIFSIGNALED(exit_status) else os.WEXITSTATUS(exit_status)
+        return {
+            RESPONSE['EXIT_CODE']: exit_code,
+            RESPONSE['CPU_USER']: round(rusage.ru_utime, 3),
+            RESPONSE['CPU_SYSTEM']: round(rusage.ru_stime, 3),
+            RESPONSE['PEAK_RSS']: rusage.ru_maxrss * 1024  # kilobytes on linux
+        }
 
-    def post(self):
-        driver_path = self.get_argument('driver-path')
+    def terminate(self, cancel_status, kill_grace=APP_SETTINGS['KILL_GRACE_S']):
+        """
+        stops the job: its process group gets SIGTERM, then SIGKILL if it is still running kill_grace seconds later
+        :param cancel_status: CANCELLED or TIMED_OUT, the status recorded for the app
+        :param kill_grace: seconds given to spark-submit to exit after SIGTERM
+        :return: None
+        """
+        with self._lock:
+            self.cancel_status = cancel_status
+            if self._process is None or self._process.returncode is not None:
+                return  # not started yet and run() won't start it, or already finished
+            self._killer = threading.Timer(kill_grace, self._signal, [signal.SIGKILL])
+            self._killer.daemon = True
+        self._signal(signal.SIGTERM)
+        self._killer.start()
 
-        if (os.path.isfile(driver_path)):
-            logfile = os.path.dirname(driver_path) + '/' + 'LOG.log'
-            sparktk_submit_jars, sparktk_driver_class_path = get_sparktk_submit_jars()
-            exec_string = 'spark-submit --jars %s --driver-class-path %s %s' % (
-            sparktk_submit_jars, sparktk_driver_class_path, driver_path)
-            spark_submit(exec_string, logfile, driver_path)
-            self.write("SparkSubmit Job Queued\n")
-        else:
-            self.write("The given path %s is not a valid script" % (driver_path))
+    def _signal(self, signum):
+        with self._lock:
+            if self._process is None or self._process.returncode is not None:
+                return  # reaped or given back to the DriverPool, its process group is no longer the job's
+            try:
+                os.killpg(self._process.pid, signum)
+            except OSError:
+                pass  # already gone
 
 
-class LogHandler(IPythonHandler):
+class WarmDriverJob(SparkSubmitJob):
+    """
+    a run of an uploaded app inside one of the pre-started pyspark drivers of a DriverPool, instead of spark-submit.
+    terminating the job stops its driver, which the pool replaces. The job fails when no driver of the pool can start.
+    the accounting of the run has no CPU times and peak memory: the driver process is shared by many jobs.
     """
-    implements the "logs" REST api endpoint.
 
-    Examples:
-        curl http://<JUPYTER_NOTEBOOK_URL>/logs -d "app-path=uploads/0001" -d "offset=1" -d "n=100"
+    def __init__(self, driver_pool, log_file, driver_path, timeout=None):
+        super(WarmDriverJob, self).__init__(None, log_file, driver_path, timeout=timeout)
+        self.driver_pool = driver_pool
+
+    def _execute(self, output, recent_lines):
+        driver = None
+        while driver is None:
+            if self.cancel_status is not None:
+                return {}
+            driver = self.driver_pool.acquire(timeout=1)
+            if driver is None:
+                start_error = self.driver_pool.start_failure()
+                if start_error is not None:
+                    output("no warm driver could start, %s\n" % start_error)
+                    raise RuntimeError(start_error)
+        with self._lock:
+            if self.cancel_status is not None:
+                self.driver_pool.release(driver)
+                return {}
+            self._process = driver.process
+            self.recent_lines = recent_lines
+        exit_code = None
+        try:
+            exit_code = driver.run(self.driver_path, output)
+        finally:
+            with self._lock:
+                self._process = None  # the driver goes back to the pool, terminate() must not signal it anymore
+            self.driver_pool.release(driver, failed=exit_code != 0)
+        return {RESPONSE['EXIT_CODE']: exit_code}
+
+
+class WarmDriver(object):
+    """
+    a sparktk_driver.py process of the DriverPool.
+    its output is read continuously by a pump thread: while a job runs it goes to the output of the job, otherwise
+    only its last lines are kept, to explain a failed start. The messages of the driver are picked out of the output.
     """
 
-    def post(self):
-        app_path = self.get_argument('app-path')
-        offset_str = self.get_argument('offset', '0', True)
-        num_lines_str = self.get_argument('n', '10', True)
+    def __init__(self, argv, env):
+        self.jobs = 0  # number of jobs run so far
+        self.alive = True
+        self.process = subprocess.Popen(argv, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, close_fds=True, preexec_fn=os.setsid)
+        self._output = None  # function receiving the output of the running job
+        self._idle_output = collections.deque(maxlen=50)
+        self._messages = Queue.Queue()
+        self._lock = threading.Lock()
+        pump = threading.Thread(target=self._pump)
+        pump.daemon = True
+        pump.start()
 
+    def wait_ready(self, timeout):
+        """
+        :param timeout: seconds given to the driver to create its contexts
+        :return: True once the driver is ready to run jobs, False if it failed or took too long
+        """
         try:
-            offset = int(offset_str)
-            num_lines = int(num_lines_str)
-        except ValueError:
-            self.write("both offset and n must be integers.")
-            return
+            message = self._messages.get(timeout=timeout)
+        except Queue.Empty:
+            return False
+        return message is not None and message.get('ready', False)
 
-        logfile = app_path + '/' + LOG_FILE
-        if (os.path.exists(app_path) and os.path.isfile(logfile)):
-            with open(logfile, 'rb') as f:
-                for i, line in enumerate(f):
-                    if (i < offset):
-                        pass
-                    elif (num_lines < 0 or i < offset + num_lines):
-                        self.write(line)
-        else:
-            self.write("Error, app-path %s doesn't exist or no logs exist yet" % (app_path))
+    def run(self, script, output):
+        """
+        :param script: path to the script run by the driver
+        :param output: function called with each chunk of the output of the script
+        :return: the exit code of the script, or the negative signal number which stopped the driver
+        """
+        with self._lock:
+            self._output = output
+        try:
+            self.process.stdin.write(json.dumps({'script': script}) + '\n')
+            self.process.stdin.flush()
+        except IOError:
+            pass  # the driver is gone, the pump reports it
+        message = self._messages.get()
+        if message is None:
+            return self.process.returncode
+        self.alive = message.get('alive', False)
+        return message['exit-code']
 
+    def stop(self, kill_grace=APP_SETTINGS['KILL_GRACE_S']):
+        """
+        asks the driver to stop its SparkContext and exit, its process group is killed if it still runs kill_grace
+        seconds later
+        """
+        self.alive = False
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        killer = threading.Timer(kill_grace, self._kill)
+        killer.daemon = True
+        killer.start()
 
-class StatusHandler(IPythonHandler):
-    """
-    implements the "logs" REST api endpoint.
+    def output_tail(self):
+        return ''.join(self._idle_output)
 
-    Examples:
-        curl http://<JUPYTER_NOTEBOOK_URL>/status -d "app-path=uploads/0001"
-    """
+    def _kill(self):
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
 
-    def post(self):
-        app_path = self.get_argument('app-path')
+    def _pump(self):
+        stdout = self.process.stdout.fileno()
+        prefix = sparktk_driver.MESSAGE_PREFIX
+        pending = b''
+        while True:
+            data = os.read(stdout, 64 * 1024)
+            if not data:
+                break
+            pending += data
+            while True:
+                start = pending.find(prefix)
+                if start < 0:
+                    # keep what could be the beginning of a message split between two reads
+                    keep = next((size for size in xrange(min(len(prefix) - 1, len(pending)), 0, -1)
+                                 if prefix.startswith(pending[-size:])), 0)
+                    self._emit(pending[:len(pending) - keep])
+                    pending = pending[len(pending) - keep:]
+                    break
+                end = pending.find('\n', start)
+                if end < 0:
+                    self._emit(pending[:start])
+                    pending = pending[start:]
+                    break
+                self._emit(pending[:start])
+                with self._lock:
+                    self._output = None
+                self._messages.put(json.loads(pending[start + len(prefix):end]))
+                pending = pending[end + 1:]
+        self._emit(pending)
+        self.process.stdout.close()
+        self.process.wait()
+        self.alive = False
+        self._messages.put(None)
 
-        status_file = app_path + '/' + STATUS_FILE
-        if (os.path.exists(app_path) and os.path.isfile(status_file)):
-            with open(status_file, 'rb') as f:
-                for i, line in enumerate(f):
-                    pass
-                self.write(line)
+    def _emit(self, data):
+        if not data:
+            return
+        with self._lock:
+            output = self._output
+        if output is not None:
+            output(data)
         else:
-            self.write("Error, app-path %s doesn't exist or no status exist yet" % (app_path))
+            self._idle_output.append(data)
 
 
-class RenameHandler(IPythonHandler):
+class DriverPool(object):
     """
-    implements the "rename" REST api endpoint.
-
-    Examples:
-        curl http://<JUPYTER_NOTEBOOK_URL>/rename -d "app-path=uploads/0001" -d "dst-path=uploads/myapp"
+    keeps size pre-started pyspark drivers (sparktk_driver.py) ready to run the jobs submitted with mode=warm, so they
+    skip the JVM and SparkContext startup of spark-submit. The drivers get the jars of the extension classpath through
+    PYSPARK_SUBMIT_ARGS, and master (local[*] works for testing) when it is given.
+    a driver is replaced after max_jobs jobs, after a failed job, and when it dies. Drivers are started on background
+    threads, with a growing delay between the attempts while they fail to start. Once size attempts in a row failed
+    and no driver is left, start_failure() reports the last error, so the waiting jobs fail instead of hanging.
     """
 
-    def post(self):
-        app_path = self.get_argument('app-path')
-        dst_path = self.get_argument('dst-path')
-        status_file_path = app_path + '/' + STATUS_FILE
-        if (os.path.exists(app_path) and os.path.isfile(status_file_path)):
-            with open(status_file_path, 'rb') as f:
-                if not (json.loads(f.readlines()[-1])['app-status'] == APP_STATUS['SUBMITTED']):
-                    os.rename(app_path, dst_path)
-                    self.write('the new path for the app is %s' % (dst_path))
-                else:
-                    self.write("Error, directory %s is in use, please try later" % (app_path))
+    def __init__(self, size, classpath, log, max_jobs=APP_SETTINGS['DRIVER_MAX_JOBS'],
+                 master=APP_SETTINGS['DRIVER_MASTER'], start_timeout=APP_SETTINGS['DRIVER_START_TIMEOUT_S']):
+        self.size = size
+        self.classpath = classpath
+        self.log = log
+        self.max_jobs = max_jobs
+        self.master = master
+        self.start_timeout = start_timeout
+        self._idle = Queue.Queue()
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._live = 0  # drivers started and not stopped yet, idle or running a job
+        self._failed_starts = 0  # failed start attempts since a driver last started
+        self._start_error = None
+
+    def start(self):
+        for i in xrange(self.size):
+            self._spawn()
+
+    def acquire(self, timeout=None):
+        """
+        :param timeout: seconds to wait for a driver
+        :return: an idle WarmDriver, None if none was ready in time
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                driver = self._idle.get(timeout=None if deadline is None else max(deadline - time.time(), 0))
+            except Queue.Empty:
+                return None
+            if driver.alive:
+                return driver
+            self._lost()
+            self._spawn()  # died while idle
+
+    def start_failure(self):
+        """
+        :return: the error of the last start attempt when no driver is left and the last size attempts failed,
+                 None while a driver is alive or may still start
+        """
+        with self._lock:
+            if self._live == 0 and self._failed_starts >= self.size:
+                return self._start_error
+            return None
+
+    def release(self, driver, failed=False):
+        """
+        gives back a driver after a job, it is replaced if the job failed or it ran max_jobs jobs
+        :return: None
+        """
+        driver.jobs += 1
+        if self._stopped or failed or not driver.alive or driver.jobs >= self.max_jobs:
+            driver.stop()
+            self._lost()
+            self._spawn()
         else:
-            self.write("Error, app-path %s doesn't exist or not a valid path" % (app_path))
+            self._idle.put(driver)
 
+    def shutdown(self):
+        self._stopped = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except Queue.Empty:
+                break
 
-class DeleteHandler(IPythonHandler):
-    """
-    implements the "delete" REST api endpoint.
+    def _lost(self):
+        with self._lock:
+            self._live -= 1
 
-    Examples:
-        curl http://<JUPYTER_NOTEBOOK_URL>/delete -d "app-path=uploads/0001"
+    def _failed_start(self, error):
+        self.log.warning("sparktk_ext: %s" % error)
+        with self._lock:
+            self._failed_starts += 1
+            self._start_error = error
+
+    def _spawn(self):
+        if self._stopped:
+            return
+        starter = threading.Thread(target=self._start_driver)
+        starter.daemon = True
+        starter.start()
+
+    def _start_driver(self):
+        delay = 0
+        while not self._stopped:
+            time.sleep(delay)
+            delay = min(max(delay * 2, 10), 600)
+            try:
+                jars, driver_class_path = self.classpath.get()
+            except (KeyError, IOError, OSError, ValueError) as e:
+                self._failed_start("could not build the classpath of a warm driver: %s" % e)
+                continue
+            submit_args = ['--jars', jars, '--driver-class-path', driver_class_path]
+            if self.master:
+                submit_args += ['--master', self.master]
+            env = dict(os.environ, PYSPARK_SUBMIT_ARGS=' '.join(pipes.quote(arg) for arg in submit_args) +
+                       ' pyspark-shell')
+            driver = WarmDriver([sys.executable, os.path.splitext(sparktk_driver.__file__)[0] + '.py'], env)
+            if driver.wait_ready(self.start_timeout):
+                with self._lock:
+                    self._live += 1
+                    self._failed_starts = 0
+                    self._start_error = None
+                self._idle.put(driver)
+                return
+            driver.stop()
+            self._failed_start("a warm driver failed to start:\n%s" % driver.output_tail())
+
+
+class JobScheduler(object):
+    """
+    long lived scheduler shared by all the spark-submit requests.
+    at most max_running jobs run at the same time, the rest wait in a priority queue
+    (lower priority values run first, jobs with equal priorities run in FIFO order).
+    each started job runs on its own thread: a cancelled job gives its slot back right away but keeps its thread
+    until its processes exit, so a thread pool sized after max_running could hold the next job back.
     """
 
-    def post(self):
-        app_path = self.get_argument('app-path')
-        status_file_path = app_path + '/' + STATUS_FILE
-        if (os.path.exists(app_path)) and os.path.isfile(status_file_path):
-            with open(status_file_path, 'rb') as f:
-                if not (json.loads(f.readlines()[-1])['app-status'] == APP_STATUS['SUBMITTED']):
-                    # TODO: Once jupyter image size is not an issue remove this and user shutil module
-                    for root, dirs, files in os.walk(top=app_path, topdown=False):
-                        for name in files:
-                            os.remove(os.path.join(root, name))
-                        for name in dirs:
-                            os.rmdir(os.path.join(root, name))
-                    os.rmdir(app_path)
-                    self.write("The app directory %s was successfully deleted" % (app_path))
-                else:
-                    self.write("Error, directory %s is in use, please try later" % (app_path))
-        else:
-            self.write("Pass, app-path %s doesn't exist or not a valid path. No action is needed." % (app_path))
+    def __init__(self, registry, max_running=APP_SETTINGS['MAX_RUNNING_JOBS'], metrics=None):
+        if max_running <= 0:
+            raise ValueError("Bad value %s.  max_running must be an integer > 0" % max_running)
+        self.registry = registry
+        self.max_running = max_running
+        self.metrics = metrics  # optional Metrics observing the duration of the finished jobs
+        self._lock = threading.Lock()
+        self._queue = []  # heap of (priority, sequence, job)
+        self._sequence = itertools.count()
+        self._running = []
+        self._threads = set()  # threads of the jobs started and not finished, cancelled ones included
+
+    def submit(self, job, priority=0):
+        """
+        queues the job, it starts as soon as a slot is available
+        :param job: the SparkSubmitJob to run
+        :param priority: jobs with lower values are started first
+        :return: None
+        """
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._sequence), job))
+        self._dispatch()
+
+    def queue_position(self, app_dir):
+        """
+        :param app_dir: the app directory of a submitted job
+        :return: 1-based position of the job in the queue, None if the job is not waiting
+        """
+        app_dir = os.path.normpath(app_dir)
+        with self._lock:
+            for position, (priority, sequence, job) in enumerate(sorted(self._queue)):
+                if os.path.normpath(job.app_dir) == app_dir:
+                    return position + 1
+        return None
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._queue)
+
+    def running_count(self):
+        with self._lock:
+            return len(self._running)
+
+    def is_active(self, app_dir):
+        """
+        :param app_dir: the app directory of a submitted job
+        :return: True while a job of the app is queued or running
+        """
+        app_dir = os.path.normpath(app_dir)
+        with self._lock:
+            jobs = self._running + [job for priority, sequence, job in self._queue]
+            return any(os.path.normpath(job.app_dir) == app_dir for job in jobs)
+
+    def recent_lines(self, app_dir):
+        """
+        :param app_dir: the app directory of a submitted job
+        :return: the RecentLines of the running job of the app, None if it is not running
+        """
+        app_dir = os.path.normpath(app_dir)
+        with self._lock:
+            for job in self._running:
+                if os.path.normpath(job.app_dir) == app_dir:
+                    return job.recent_lines
+        return None
+
+    def cancel(self, app_dir, cancel_status=APP_STATUS['CANCELLED']):
+        """
+        cancels the queued and running jobs of the app, their slots are given to the next queued jobs right away
+        :param app_dir: the app directory of a submitted job
+        :param cancel_status: CANCELLED or TIMED_OUT, the status recorded for the app
+        :return: the number of jobs cancelled
+        """
+        app_dir = os.path.normpath(app_dir)
+        with self._lock:
+            queued = [entry for entry in self._queue if os.path.normpath(entry[2].app_dir) == app_dir]
+            running = [job for job in self._running if os.path.normpath(job.app_dir) == app_dir]
+            if queued:
+                self._queue = [entry for entry in self._queue if entry not in queued]
+                heapq.heapify(self._queue)
+            for job in running:
+                self._running.remove(job)
+        for priority, sequence, job in queued:
+            job.cancel_status = cancel_status
+            status = self.registry.update(job.driver_path, cancel_status, allowed=[APP_STATUS['SUBMITTED']])
+            self._finished(job, status)
+        for job in running:
+            self._terminate(job, cancel_status)
+        self._dispatch()
+        return len(queued) + len(running)
+
+    def _terminate(self, job, cancel_status):
+        # the status is recorded before the signal, the accounting of the run is added by mark_completed
+        job.cancel_status = cancel_status
+        self.registry.update(job.driver_path, cancel_status, allowed=[APP_STATUS['SUBMITTED']])
+        job.terminate(cancel_status)
+
+    def _expire(self, job):
+        with self._lock:
+            if job not in self._running:
+                return  # finished or cancelled meanwhile
+            self._running.remove(job)
+        self._terminate(job, APP_STATUS['TIMED_OUT'])
+        self._dispatch()
+
+    def shutdown(self, wait=False):
+        """drops the queued jobs, and waits for the running jobs to finish when wait is True"""
+        with self._lock:
+            self._queue = []
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _dispatch(self):
+        started = []
+        with self._lock:
+            while self._queue and len(self._running) < self.max_running:
+                priority, sequence, job = heapq.heappop(self._queue)
+                self._running.append(job)
+                started.append(job)
+        # futures may complete (and call back into the scheduler) before add_done_callback returns,
+        # so they are created outside the lock
+        for job in started:
+            future = concurrent.futures.Future()
+            future.driver_path = job.driver_path
+            future.add_done_callback(functools.partial(self._on_done, job))
+            thread = threading.Thread(target=self._run, args=(job, future))
+            with self._lock:
+                self._threads.add(thread)
+            thread.start()
+
+    def _run(self, job, future):
+        # the timeout counts from the start of the run
+        if job.timeout is not None:
+            job.timer = threading.Timer(job.timeout, self._expire, [job])
+            job.timer.daemon = True
+            job.timer.start()
+        try:
+            future.set_running_or_notify_cancel()
+            try:
+                accounting = job.run()
+            except BaseException:
+                future.set_exception_info(*sys.exc_info()[1:])
+            else:
+                future.set_result(accounting)
+        finally:
+            with self._lock:
+                self._threads.discard(threading.current_thread())
+
+    def _on_done(self, job, future):
+        with self._lock:
+            if job in self._running:
+                self._running.remove(job)
+        if job.timeout is not None:
+            job.timer.cancel()
+        try:
+            status = mark_completed(self.registry, job, future)
+            if self.metrics is not None and status is not None and RESPONSE['RUN_DURATION'] in status:
+                self.metrics.observe_job(status[RESPONSE['APP_STATUS']], status[RESPONSE['RUN_DURATION']])
+            self._finished(job, status)
+        finally:
+            self._dispatch()
+
+    @staticmethod
+    def _finished(job, status):
+        if job.on_finished is not None:
+            if status is not None:
+                job.on_finished(status[RESPONSE['APP_STATUS']])
+            else:  # cancelled before it started
+                job.on_finished(job.cancel_status or APP_STATUS['FAILED'])
+
+
+def spark_submit(scheduler, argv, log_file, driver_path, priority=0, timeout=None, driver_pool=None, on_finished=None):
+    """
+    asynchronously run the pyspark/sparktk submitted script while writing the logs to the log_file for the app
+    :param scheduler: the JobScheduler shared by the extension
+    :param argv: the command line that is going to be run, without a shell
+    :param log_file: the file containing command(script) logs while running
+    :param driver_path: the path to the main sparktk/pyspark script within the uploads folder
+    :param priority: position of the job in the scheduler queue, lower values run first
+    :param timeout: optional number of seconds after which the running job is terminated as TIMED_OUT
+    :param driver_pool: optional DriverPool, the script then runs in one of its warm drivers instead of spark-submit
+    :param on_finished: optional function called with the final app status once the job finished or was cancelled
+    :return: None
+    """
+    mark_submitted(scheduler.registry, driver_path)
+    if driver_pool is not None:
+        job = WarmDriverJob(driver_pool, log_file, driver_path, timeout=timeout)
+    else:
+        job = SparkSubmitJob(argv, log_file, driver_path, timeout=timeout)
+    job.on_finished = on_finished
+    scheduler.submit(job, priority=priority)
+
+
+def submit_driver(scheduler, classpath, driver_path, priority=0, timeout=None, driver_pool=None, on_finished=None):
+    """
+    queues the spark-submit of the script with the sparktk jars, or its run in a warm driver of driver_pool
+    :param scheduler: the JobScheduler shared by the extension
+    :param classpath: the SparkTKClasspath of the extension
+    :param driver_path: the path to the main sparktk/pyspark script within the uploads folder
+    :return: None
+    """
+    logfile = os.path.dirname(driver_path) + '/' + LOG_FILE
+    argv = None
+    if driver_pool is None:
+        sparktk_submit_jars, sparktk_driver_class_path = classpath.get()
+        argv = ['spark-submit', '--jars', sparktk_submit_jars, '--driver-class-path', sparktk_driver_class_path,
+                driver_path]
+    spark_submit(scheduler, argv, logfile, driver_path, priority=priority, timeout=timeout, driver_pool=driver_pool,
+                 on_finished=on_finished)
+
+
+def mark_completed(registry, job, future):
+    """
+    once the application has finished running, updates the status_file with a new entry for COMPLETED,
+    or FAILED when spark-submit could not run or returned a non-zero exit code, along with the job accounting.
+    cancelled jobs keep their CANCELLED or TIMED_OUT status.
+    :param registry: the StatusRegistry of the extension
+    :param job: the SparkSubmitJob that finished
+    :param future: the future of SparkSubmitJob.run
+    :return: the status entry recorded as a dict, None if there was none
+    """
+    if future.exception() is not None:
+        return registry.update(job.driver_path, APP_STATUS['FAILED'])
+    accounting = future.result()
+    if job.cancel_status is not None:
+        if not accounting:
+            return None  # cancelled before it started
+        return registry.update(job.driver_path, job.cancel_status, details=accounting,
+                               allowed=[APP_STATUS['SUBMITTED'], job.cancel_status])
+    app_status = APP_STATUS['COMPLETED'] if accounting[RESPONSE['EXIT_CODE']] == 0 else APP_STATUS['FAILED']
+    return registry.update(job.driver_path, app_status, details=accounting)
+
+
+# TODO: this is only a workaround to ublock the spark-submit against sparktk apps while the bug is being fixed.
+def get_sparktk_submit_jars(dir_mtimes=None):
+    """
+    spark-submit requires sparktk apps to provide values for both --jars and --driver-class-path options.
+    This function finds these jars.
+    :param dir_mtimes: optional dict, filled with the modification time of every directory that was scanned
+    :return: a list of strings and a string to be used for --jars and --driver-class-path command line option values
+    """
+    extns = ('.jar')
+    sparktk_submit_jars = []
+
+    for home in (os.environ['SPARK_HOME'], os.environ['SPARKTK_HOME']):
+        for root, dirnames, fns in os.walk(home):
+            sparktk_submit_jars.extend(os.path.join(root, fn) for fn in fns if fn.lower().endswith(extns))
+            if dir_mtimes is not None:
+                dir_mtimes[root] = os.stat(root).st_mtime
+    sparktk_driver_class_path = \
+        os.environ['SPARK_HOME'] + \
+        "/lib/*:" + os.environ['SPARKTK_HOME'] \
+        + "/*:" + os.environ['SPARKTK_HOME'] + \
+        "/dependencies/*"
+
+    return ','.join(sparktk_submit_jars), sparktk_driver_class_path
+
+
+class SparkTKClasspath(object):
+    """
+    caches the values returned by get_sparktk_submit_jars.
+    the jars are searched once, and searched again only when the modification time of one of the scanned
+    directories changed. The result is also saved to the optional cache_file so restarts do not need a new search.
+    A pinned manifest (a json file with "jars" and "driver-class-path" entries) is used as is and never searched again.
+    """
+
+    def __init__(self, cache_file=None, pinned_manifest=None):
+        self.cache_file = cache_file
+        self.pinned_manifest = pinned_manifest
+        self._lock = threading.Lock()
+        self._manifest = None
+
+    def get(self):
+        """
+        :return: a string and a string to be used for --jars and --driver-class-path command line option values
+        """
+        with self._lock:
+            if self._manifest is None:
+                self._manifest = self._load()
+            if self._manifest is None or self._is_stale(self._manifest):
+                self._manifest = self._scan()
+                self._save(self._manifest)
+            return self._manifest['jars'], self._manifest['driver-class-path']
+
+    def _load(self):
+        path = self.pinned_manifest or self.cache_file
+        if not path or not os.path.isfile(path):
+            if self.pinned_manifest:
+                raise IOError("The pinned classpath manifest %s doesn't exist" % self.pinned_manifest)
+            return None
+        with open(path, 'rb') as f:
+            manifest = json.load(f)
+        if isinstance(manifest['jars'], list):
+            manifest['jars'] = ','.join(manifest['jars'])
+        return manifest
+
+    def _is_stale(self, manifest):
+        if self.pinned_manifest:
+            return False
+        for dir_name, mtime in manifest['dir-mtimes'].iteritems():
+            try:
+                if os.stat(dir_name).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    @staticmethod
+    def _scan():
+        dir_mtimes = {}
+        jars, driver_class_path = get_sparktk_submit_jars(dir_mtimes)
+        return {'jars': jars, 'driver-class-path': driver_class_path, 'dir-mtimes': dir_mtimes}
+
+    def _save(self, manifest):
+        if not self.cache_file:
+            return
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            json.dump(manifest, f)
+        os.rename(tmp_file, self.cache_file)
+
+
+class FileDigests(object):
+    """
+    sha256 of files, remembered by inode, size and modification time so unchanged files are hashed once.
+    the files of the app directories are hard links to the blobs of their content, an upload seen before costs nothing.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._digests = collections.OrderedDict()  # (st_dev, st_ino, st_size, st_mtime) -> sha256, least recent first
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+        with self._lock:
+            digest = self._digests.pop(key, None)
+            if digest is not None:
+                self._digests[key] = digest
+                return digest
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(functools.partial(f.read, 1024 ** 2), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+        with self._lock:
+            self._digests[key] = digest
+            while len(self._digests) > self.max_entries:
+                self._digests.popitem(last=False)
+        return digest
+
+
+def is_app_log_file(name):
+    """
+    :param name: name of a file of an app directory
+    :return: whether the file is written by the extension rather than uploaded
+    """
+    return name == STATUS_FILE or name.startswith(LOG_FILE)
+
+
+def fingerprint_submit(driver_path, input_paths, digests, extra=None):
+    """
+    identifies a run of the script by what it depends on: the content of the uploaded files of its app directory,
+    the size and modification time of the files under input_paths, and extra (e.g. the classpath)
+    :param driver_path: the path to the main sparktk/pyspark script within the uploads folder
+    :param input_paths: local files or directories read by the script
+    :param digests: the FileDigests of the extension
+    :param extra: optional json serializable value the result depends on
+    :return: the sha256 fingerprint
+    :raise OSError: when an input path doesn't exist
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps([os.path.basename(driver_path), extra]))
+    app_dir = os.path.dirname(driver_path)
+    for root, dirs, files in os.walk(app_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if root == app_dir and is_app_log_file(name):
+                continue
+            path = os.path.join(root, name)
+            sha256.update(json.dumps([os.path.relpath(path, app_dir), digests.get(path)]))
+    for input_path in sorted(set(os.path.abspath(input_path) for input_path in input_paths)):
+        stat = os.stat(input_path)
+        sha256.update(json.dumps([input_path, stat.st_size, stat.st_mtime]))
+        for root, dirs, files in os.walk(input_path):
+            dirs.sort()
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                sha256.update(json.dumps([os.path.join(root, name), stat.st_size, stat.st_mtime]))
+    return sha256.hexdigest()
+
+
+class SubmitCache(object):
+    """
+    results of the successful cached submits (cache=true), by fingerprint of the run, see fingerprint_submit.
+    each entry is a directory <path>/<fingerprint> holding a copy of the log of the run and a status.json with its
+    accounting and the app it came from. Entries are evicted least recently used first once they take more than
+    max_bytes; the last use is the modification time of status.json, so the order survives restarts.
+    """
+
+    STATUS_FILE = 'status.json'
+    ACCOUNTING = [RESPONSE['EXIT_CODE'], RESPONSE['QUEUE_WAIT'], RESPONSE['RUN_DURATION'], RESPONSE['CPU_USER'],
+                  RESPONSE['CPU_SYSTEM'], RESPONSE['PEAK_RSS']]
+
+    def __init__(self, path=APP_SETTINGS['SUBMIT_CACHE_PATH'], max_bytes=APP_SETTINGS['SUBMIT_CACHE_MAX_BYTES']):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.digests = FileDigests()
+        self.size = 0
+        self._entries = collections.OrderedDict()  # fingerprint -> size in bytes, least recently used first
+        self._lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        entries = []
+        for name in os.listdir(path):
+            status_path = os.path.join(path, name, self.STATUS_FILE)
+            if os.path.isfile(status_path):
+                entries.append((os.stat(status_path).st_mtime, name, get_app_dir_size(os.path.join(path, name))))
+            else:
+                shutil.rmtree(os.path.join(path, name))  # interrupted store
+        for mtime, fingerprint, size in sorted(entries):
+            self._entries[fingerprint] = size
+            self.size += size
+
+    def restore(self, fingerprint, app_dir):
+        """
+        replaces the log of app_dir by the log of the cached run
+        :param fingerprint: fingerprint of the run
+        :param app_dir: the app directory submitted
+        :return: the accounting of the cached run along with the app it came from, None when it is not cached
+        """
+        entry_path = os.path.join(self.path, fingerprint)
+        with self._lock:
+            if fingerprint not in self._entries:
+                return None
+            self._entries[fingerprint] = self._entries.pop(fingerprint)
+            try:
+                with open(os.path.join(entry_path, self.STATUS_FILE), 'rb') as f:
+                    details = json.load(f)
+                os.utime(os.path.join(entry_path, self.STATUS_FILE), None)
+                for name in os.listdir(app_dir):
+                    if name.startswith(LOG_FILE):
+                        os.remove(os.path.join(app_dir, name))
+                for name in os.listdir(entry_path):
+                    if name != self.STATUS_FILE:
+                        shutil.copyfile(os.path.join(entry_path, name), os.path.join(app_dir, name))
+                manifest = read_log_manifest(app_dir)
+                if manifest.pop('active-inode', None) is not None:
+                    # the copy is a new file, AppLog would take the inode of the cached run for a concurrent rotation
+                    if os.path.exists(os.path.join(app_dir, LOG_FILE)):
+                        manifest['active-inode'] = os.stat(os.path.join(app_dir, LOG_FILE)).st_ino
+                    write_log_manifest(app_dir, manifest)
+            except (IOError, OSError, ValueError):
+                return None
+        return details
+
+    def store(self, fingerprint, status):
+        """
+        keeps the log and the accounting of a completed run, then evicts the least recently used entries
+        :param fingerprint: fingerprint of the run
+        :param status: the COMPLETED status of the app
+        :return: None
+        """
+        app_dir = status[RESPONSE['APP_DIR']]
+        details = dict((key, status[key]) for key in self.ACCOUNTING if key in status)
+        details[RESPONSE['CACHED_FROM']] = app_dir
+        entry_path = os.path.join(self.path, fingerprint)
+        tmp_path = tempfile.mkdtemp(dir=self.path, prefix='.')
+        try:
+            for name in os.listdir(app_dir):
+                if name.startswith(LOG_FILE) and name != LOG_INDEX_FILE and not name.endswith('.tmp'):
+                    shutil.copyfile(os.path.join(app_dir, name), os.path.join(tmp_path, name))
+            with open(os.path.join(tmp_path, self.STATUS_FILE), 'wb') as f:
+                json.dump(details, f)
+            size = get_app_dir_size(tmp_path)
+            with self._lock:
+                if fingerprint in self._entries:
+                    self.size -= self._entries.pop(fingerprint)
+                    shutil.rmtree(entry_path)
+                os.rename(tmp_path, entry_path)
+                self._entries[fingerprint] = size
+                self.size += size
+                while self.size > self.max_bytes and self._entries:
+                    evicted, evicted_size = self._entries.popitem(last=False)
+                    shutil.rmtree(os.path.join(self.path, evicted), ignore_errors=True)
+                    self.size -= evicted_size
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+
+
+def cache_completed_run(submit_cache, registry, driver_path, input_paths, extra, fingerprint, app_status):
+    """
+    on_finished of the cache=true jobs: adds the run to the cache when it completed and its inputs didn't change
+    while it ran
+    :return: None
+    """
+    if app_status != APP_STATUS['COMPLETED']:
+        return
+    try:
+        if fingerprint_submit(driver_path, input_paths, submit_cache.digests, extra) == fingerprint:
+            submit_cache.store(fingerprint, registry.get(os.path.dirname(driver_path)))
+    except (IOError, OSError):
+        pass  # the app or an input was removed meanwhile, the run is not cached
+
+
+class SparkSubmitHandler(SparkTKHandler):
+    """
+    implements the "spark-submit" REST api end point
+    jobs are queued in the shared scheduler, the optional priority argument moves a job ahead (lower values) in the queue
+    with mode=warm the script runs in a pre-started pyspark driver of the DriverPool, when the pool is enabled
+    with cache=true the run is fingerprinted (see fingerprint_submit, "input" lists the local paths read by the script)
+    and when a successful run with the same fingerprint is in the SubmitCache, its log is copied to the app and its
+    status returned right away instead of running spark-submit; otherwise a successful run is added to the cache.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/spark-submit -d "driver-path=uploads/0001/frame-basics.py"
+        curl http://<JUPYTER_NOTEBOOK_URL>/spark-submit -d "driver-path=uploads/0001/frame-basics.py" -d "priority=-1"
+        curl http://<JUPYTER_NOTEBOOK_URL>/spark-submit -d "driver-path=uploads/0001/frame-basics.py" -d "timeout=3600"
+        curl http://<JUPYTER_NOTEBOOK_URL>/spark-submit -d "driver-path=uploads/0001/frame-basics.py" -d "mode=warm"
+        curl http://<JUPYTER_NOTEBOOK_URL>/spark-submit -d "driver-path=uploads/0001/frame-basics.py" -d "cache=true" \
+            -d "input=/data/frames/cities.csv"
+    """
+
+    @gen.coroutine
+    def post(self):
+        driver_path = self.get_argument('driver-path')
+        priority_str = self.get_argument('priority', '0', True)
+        timeout_str = self.get_argument('timeout', None, True)
+        mode = self.get_argument('mode', 'submit', True)
+        cache = self.get_argument('cache', 'false', True).lower() in ('true', '1')
+        input_paths = self.get_arguments('input')
+
+        try:
+            priority = int(priority_str)
+            timeout = None if timeout_str is None else float(timeout_str)
+        except ValueError:
+            self.write("priority must be an integer and timeout a number.")
+            return
+        if mode not in ('submit', 'warm'):
+            self.write("mode must be submit or warm.")
+            return
+        if mode == 'warm' and self.driver_pool is None:
+            self.write("mode=warm needs the driver pool, enable it with SPARKTK_EXT_DRIVER_POOL_SIZE.")
+            return
+
+        self.write((yield self.queue_job(driver_path, priority, timeout, mode, cache, input_paths)))
+
+    @run_on_executor(executor='io_pool')
+    def queue_job(self, driver_path, priority, timeout, mode, cache, input_paths):
+        if (os.path.isfile(driver_path)):
+            on_finished = None
+            if cache:
+                remote_paths = [input_path for input_path in input_paths if '://' in input_path]
+                if remote_paths:
+                    return "Error, input %s is not a local path, cache=true can't fingerprint it" % (remote_paths[0])
+                extra = list(self.classpath.get())
+                try:
+                    fingerprint = fingerprint_submit(driver_path, input_paths, self.submit_cache.digests, extra)
+                except OSError as e:
+                    return "Error, input %s doesn't exist, cache=true needs local input paths" % (e.filename)
+                app_dir = os.path.dirname(driver_path)
+                if not self.scheduler.is_active(app_dir):
+                    details = self.submit_cache.restore(fingerprint, app_dir)
+                    if details is not None:
+                        self.log_indexes.discard(app_dir)
+                        return json.dumps(self.registry.update(driver_path, APP_STATUS['COMPLETED'], details=details))
+                on_finished = functools.partial(cache_completed_run, self.submit_cache, self.registry, driver_path,
+                                                input_paths, extra, fingerprint)
+            submit_driver(self.scheduler, self.classpath, driver_path, priority=priority, timeout=timeout,
+                          driver_pool=self.driver_pool if mode == 'warm' else None, on_finished=on_finished)
+            return "SparkSubmit Job Queued\n"
+        else:
+            return "The given path %s is not a valid script" % (driver_path)
+
+
+class CancelHandler(SparkTKHandler):
+    """
+    implements the "cancel" REST api endpoint.
+    removes the queued job of the app from the scheduler, or terminates its running spark-submit process group.
+    with batch-id every step of a /batch-submit batch not finished yet is cancelled.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/cancel -d "app-path=uploads/0001"
+        curl http://<JUPYTER_NOTEBOOK_URL>/cancel -d "batch-id=<batch-id>"
+    """
+
+    @gen.coroutine
+    def post(self):
+        batch_id = self.get_argument('batch-id', None, True)
+        if batch_id is not None:
+            self.write((yield self.cancel_batch(batch_id)))
+            return
+        app_path = self.get_argument('app-path')
+
+        self.write((yield self.cancel_app(app_path)))
+
+    @run_on_executor(executor='io_pool')
+    def cancel_batch(self, batch_id):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return "Error, batch-id %s doesn't exist" % (batch_id)
+        if batch.cancel(self.scheduler):
+            return "The batch %s was cancelled" % (batch_id)
+        else:
+            return "Pass, batch-id %s has no step left to run. No action is needed." % (batch_id)
+
+    @run_on_executor(executor='io_pool')
+    def cancel_app(self, app_path):
+        if self.scheduler.cancel(app_path):
+            return "The app %s was cancelled" % (app_path)
+        else:
+            return "Pass, app-path %s has no queued or running job. No action is needed." % (app_path)
+
+
+def parse_batch(driver_paths, edges):
+    """
+    :param driver_paths: the scripts of the steps of a batch, each in its own app directory
+    :param edges: list of "<driver path>:<driver path it runs after>"
+    :return: dict of the set of driver paths each step runs after
+    :raise ValueError: when a step is repeated, unknown, or the steps depend on each other in a cycle
+    """
+    if not driver_paths:
+        raise ValueError("at least one driver-path must be given")
+    app_dirs = set(os.path.normpath(os.path.dirname(driver_path)) for driver_path in driver_paths)
+    if len(app_dirs) != len(driver_paths):
+        raise ValueError("each driver-path of a batch must be in its own app directory")
+    upstream = dict((driver_path, set()) for driver_path in driver_paths)
+    for edge in edges:
+        driver_path, sep, dependency = edge.rpartition(':')
+        if not sep or driver_path not in upstream or dependency not in upstream:
+            raise ValueError("after %s must be <driver-path>:<driver-path> of steps of the batch" % edge)
+        upstream[driver_path].add(dependency)
+    # kahn's algorithm: the steps left once the ones without dependencies are removed repeatedly form a cycle
+    remaining = dict((driver_path, set(dependencies)) for driver_path, dependencies in upstream.items())
+    ready = [driver_path for driver_path, dependencies in remaining.items() if not dependencies]
+    while ready:
+        done = ready.pop()
+        del remaining[done]
+        for driver_path, dependencies in remaining.items():
+            if done in dependencies:
+                dependencies.discard(done)
+                if not dependencies:
+                    ready.append(driver_path)
+    if remaining:
+        raise ValueError("the steps %s depend on each other in a cycle" % ', '.join(sorted(remaining)))
+    return upstream
+
+
+class Batch(object):
+    """
+    apps submitted together by /batch-submit, run as a DAG of steps: each step is queued in the scheduler once every
+    step it runs after completed, so independent steps run in parallel within MAX_RUNNING_JOBS and the client doesn't
+    submit them one by one. When a step doesn't complete (failed, cancelled, timed out) the steps depending on it,
+    directly or not, are SKIPPED.
+    every step is SUBMITTED from the start of the batch, until it finishes; the batch is SUBMITTED until all of them
+    finished, then COMPLETED when they all completed, CANCELLED when it was cancelled, FAILED otherwise.
+    """
+
+    def __init__(self, batch_id, driver_paths, upstream, submit_step, registry, io_loop):
+        self.id = batch_id
+        self.driver_paths = driver_paths
+        self.upstream = upstream  # driver path -> set of the driver paths it runs after
+        self.downstream = collections.defaultdict(list)  # driver path -> driver paths running after it
+        for driver_path in driver_paths:
+            for dependency in upstream[driver_path]:
+                self.downstream[dependency].append(driver_path)
+        self.statuses = {}  # driver path -> final app status of the finished steps
+        self.started = set()
+        self.cancelled = False
+        self.finished_at = None
+        self._submit_step = submit_step  # function(driver_path, on_finished) queueing the job of a step
+        self._registry = registry
+        self._io_loop = io_loop
+        self._lock = threading.Lock()
+        self._waiters = []
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def app_status(self):
+        """
+        :return: the aggregate status of the batch
+        """
+        with self._lock:
+            if self.finished_at is None:
+                return APP_STATUS['SUBMITTED']
+            statuses = set(self.statuses.values())
+        if statuses == set([APP_STATUS['COMPLETED']]):
+            return APP_STATUS['COMPLETED']
+        if self.cancelled:
+            return APP_STATUS['CANCELLED']
+        return APP_STATUS['FAILED']
+
+    def start(self):
+        """
+        marks every step SUBMITTED and queues the steps that don't run after any other
+        :return: None
+        """
+        for driver_path in self.driver_paths:
+            mark_submitted(self._registry, driver_path)
+        with self._lock:
+            roots = [driver_path for driver_path in self.driver_paths if not self.upstream[driver_path]]
+            self.started.update(roots)
+        self._start(roots)
+
+    def cancel(self, scheduler):
+        """
+        cancels the running and queued steps, and the ones still waiting for the steps they run after
+        :param scheduler: the JobScheduler running the steps
+        :return: the number of steps cancelled
+        """
+        with self._lock:
+            self.cancelled = True
+            waiting = [driver_path for driver_path in self.driver_paths
+                       if driver_path not in self.started and driver_path not in self.statuses]
+            for driver_path in waiting:
+                self.statuses[driver_path] = APP_STATUS['CANCELLED']
+            started = [driver_path for driver_path in self.started if driver_path not in self.statuses]
+        for driver_path in waiting:
+            self._registry.update(driver_path, APP_STATUS['CANCELLED'], allowed=[APP_STATUS['SUBMITTED']])
+        cancelled = len(waiting)
+        for driver_path in started:
+            cancelled += scheduler.cancel(os.path.dirname(driver_path))  # step_finished follows
+        self._check_finished()
+        return cancelled
+
+    def step_finished(self, driver_path, app_status):
+        """
+        queues the steps whose dependencies all completed, or skips the ones depending on a step that didn't complete
+        :param driver_path: the step that finished
+        :param app_status: its final status
+        :return: None
+        """
+        ready, skipped = [], []
+        with self._lock:
+            self.statuses[driver_path] = app_status
+            if app_status == APP_STATUS['COMPLETED']:
+                if not self.cancelled:
+                    for candidate in self.downstream[driver_path]:
+                        if candidate not in self.started and all(self.statuses.get(dependency) == app_status
+                                                                 for dependency in self.upstream[candidate]):
+                            self.started.add(candidate)
+                            ready.append(candidate)
+            else:
+                pending = list(self.downstream[driver_path])
+                while pending:
+                    candidate = pending.pop()
+                    if candidate not in self.started and candidate not in self.statuses:
+                        self.statuses[candidate] = APP_STATUS['SKIPPED']
+                        skipped.append(candidate)
+                        pending.extend(self.downstream[candidate])
+        for candidate in skipped:
+            self._registry.update(candidate, APP_STATUS['SKIPPED'], allowed=[APP_STATUS['SUBMITTED']])
+        self._start(ready)
+        self._check_finished()
+
+    def wait(self):
+        """
+        to be called on the IOLoop
+        :return: Future resolved once every step finished
+        """
+        future = Future()
+        if self.finished:
+            future.set_result(None)
+        else:
+            self._waiters.append(future)
+        return future
+
+    def _start(self, driver_paths):
+        for driver_path in driver_paths:
+            try:
+                self._submit_step(driver_path, functools.partial(self.step_finished, driver_path))
+            except (IOError, OSError, KeyError, ValueError):
+                # e.g. the script was deleted, or the classpath can't be built
+                self._registry.update(driver_path, APP_STATUS['FAILED'], allowed=[APP_STATUS['SUBMITTED']])
+                self.step_finished(driver_path, APP_STATUS['FAILED'])
+
+    def _check_finished(self):
+        with self._lock:
+            if self.finished_at is not None or len(self.statuses) < len(self.driver_paths):
+                return
+            self.finished_at = time.time()
+        self._io_loop.add_callback(self._wake)
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            future.set_result(None)
+
+
+class Batches(object):
+    """
+    the batches of the extension, in memory: the oldest finished ones are forgotten beyond max_finished
+    """
+
+    def __init__(self, registry, io_loop, max_finished=APP_SETTINGS['BATCHES_KEPT']):
+        self.registry = registry
+        self.io_loop = io_loop
+        self.max_finished = max_finished
+        self._batches = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, driver_paths, upstream, submit_step):
+        """
+        :param driver_paths: the scripts of the steps
+        :param upstream: dict of the set of driver paths each step runs after, see parse_batch
+        :param submit_step: function(driver_path, on_finished) queueing the job of a step
+        :return: the new Batch, not started yet
+        """
+        batch = Batch(uuid.uuid4().hex, driver_paths, upstream, submit_step, self.registry, self.io_loop)
+        with self._lock:
+            self._batches[batch.id] = batch
+            finished = [batch_id for batch_id, kept in self._batches.items() if kept.finished]
+            for batch_id in finished[:max(len(finished) - self.max_finished, 0)]:
+                del self._batches[batch_id]
+        return batch
+
+    def get(self, batch_id):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+
+class BatchSubmitHandler(SparkTKHandler):
+    """
+    implements the "batch-submit" REST api endpoint.
+    submits several uploaded scripts at once (driver-path repeated, each in its own app directory) as a DAG: after
+    "<driver-path>:<driver-path>" makes the first step run once the second one completed. The steps are run by the
+    shared scheduler as soon as their dependencies completed, see Batch. priority, timeout and mode apply to every step
+    as for /spark-submit. The batch-id returned is given to /batch-status and /cancel.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/batch-submit -d "driver-path=uploads/0001/ingest.py" \\
+            -d "driver-path=uploads/0002/features.py" -d "driver-path=uploads/0003/train.py" \\
+            -d "after=uploads/0002/features.py:uploads/0001/ingest.py" \\
+            -d "after=uploads/0003/train.py:uploads/0002/features.py"
+    """
+
+    @gen.coroutine
+    def post(self):
+        driver_paths = self.get_arguments('driver-path')
+        edges = self.get_arguments('after')
+        priority_str = self.get_argument('priority', '0', True)
+        timeout_str = self.get_argument('timeout', None, True)
+        mode = self.get_argument('mode', 'submit', True)
+
+        try:
+            priority = int(priority_str)
+            timeout = None if timeout_str is None else float(timeout_str)
+        except ValueError:
+            self.write("priority must be an integer and timeout a number.")
+            return
+        if mode not in ('submit', 'warm'):
+            self.write("mode must be submit or warm.")
+            return
+        if mode == 'warm' and self.driver_pool is None:
+            self.write("mode=warm needs the driver pool, enable it with SPARKTK_EXT_DRIVER_POOL_SIZE.")
+            return
+        try:
+            upstream = parse_batch(driver_paths, edges)
+        except ValueError as e:
+            self.write("Error, %s" % e)
+            return
+
+        self.write((yield self.submit_batch(driver_paths, upstream, priority, timeout, mode)))
+
+    @run_on_executor(executor='io_pool')
+    def submit_batch(self, driver_paths, upstream, priority, timeout, mode):
+        for driver_path in driver_paths:
+            if not os.path.isfile(driver_path):
+                return "The given path %s is not a valid script" % (driver_path)
+        scheduler, classpath = self.scheduler, self.classpath
+        driver_pool = self.driver_pool if mode == 'warm' else None
+
+        def submit_step(driver_path, on_finished):
+            submit_driver(scheduler, classpath, driver_path, priority=priority, timeout=timeout,
+                          driver_pool=driver_pool, on_finished=on_finished)
+
+        batch = self.batches.create(driver_paths, upstream, submit_step)
+        batch.start()
+        return json.dumps({RESPONSE['BATCH_ID']: batch.id, RESPONSE['BATCH_STATUS']: batch.app_status()})
+
+
+class BatchStatusHandler(SparkTKHandler):
+    """
+    implements the "batch-status" REST api endpoint.
+    returns the aggregate batch-status of a batch and the status of each of its steps. With a timeout the request
+    waits up to timeout seconds for the batch to finish, so clients don't poll every step.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/batch-status -d "batch-id=<batch-id>"
+        curl http://<JUPYTER_NOTEBOOK_URL>/batch-status -d "batch-id=<batch-id>" -d "timeout=60"
+    """
+
+    @gen.coroutine
+    def post(self):
+        batch_id = self.get_argument('batch-id')
+        timeout_str = self.get_argument('timeout', '0', True)
+
+        try:
+            timeout = float(timeout_str)
+        except ValueError:
+            self.write("timeout must be a number.")
+            return
+
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            self.write("Error, batch-id %s doesn't exist" % (batch_id))
+            return
+        if timeout > 0:
+            try:
+                yield gen.with_timeout(timedelta(seconds=timeout), batch.wait())
+            except gen.TimeoutError:
+                pass
+
+        self.write((yield self.read_batch(batch)))
+
+    get = post
+
+    @run_on_executor(executor='io_pool')
+    def read_batch(self, batch):
+        app_status = batch.app_status()  # before the steps, so a finished batch shows its steps finished
+        return json.dumps({RESPONSE['BATCH_ID']: batch.id,
+                           RESPONSE['BATCH_STATUS']: app_status,
+                           RESPONSE['STEPS']: [self.registry.get(os.path.dirname(driver_path))
+                                               for driver_path in batch.driver_paths]})
+
+
+def read_log_manifest(app_dir):
+    """
+    :param app_dir: the app directory
+    :return: the LOG_MANIFEST_FILE of the app as a dict, an empty manifest if its log was never rotated
+    """
+    try:
+        with open(app_dir + '/' + LOG_MANIFEST_FILE) as f:
+            return json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    return {'next-seq': 1, 'segments': [], 'dropped-lines': 0, 'dropped-bytes': 0}
+
+
+def write_log_manifest(app_dir, manifest):
+    manifest_path = app_dir + '/' + LOG_MANIFEST_FILE
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.rename(manifest_path + '.tmp', manifest_path)  # readers never see a partial manifest
+
+
+def get_log_size(app_dir):
+    """
+    :param app_dir: the app directory
+    :return: the number of bytes written to the app log, including its rotated and dropped segments
+    """
+    manifest = read_log_manifest(app_dir)
+    size = manifest['dropped-bytes'] + sum(segment['bytes'] for segment in manifest['segments'])
+    try:
+        size += os.path.getsize(app_dir + '/' + LOG_FILE)
+    except OSError:
+        pass
+    return size
+
+
+class RotatingLogWriter(object):
+    """
+    appends the output of a job to the LOG_FILE of its app.
+    once LOG_FILE reaches segment_bytes it is rotated at the next line end: renamed to LOG.log.<seq>, gzip compressed
+    and listed in LOG_MANIFEST_FILE with its number of lines and bytes, so readers can still number lines and bytes
+    from the start of the whole log. When max_bytes is set the oldest segments are dropped to keep the log under it.
+    a segment is compressed as a series of gzip members of about block_bytes each, starting at a line, and the
+    manifest lists the [byte, compressed byte, line] where each of them starts ("blocks"), so readers decompress from
+    the block they need rather than from the start of the segment. The file is still a regular gzip file.
+    """
+
+    compress_level = 6
+    block_bytes = 1024 ** 2
+
+    def __init__(self, app_dir, segment_bytes=APP_SETTINGS['LOG_SEGMENT_BYTES'],
+                 max_bytes=APP_SETTINGS['LOG_MAX_APP_BYTES']):
+        self.app_dir = app_dir
+        self.log_path = app_dir + '/' + LOG_FILE
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.manifest = read_log_manifest(app_dir)
+        self._file = open(self.log_path, 'ab', 0)  # unbuffered, followers see the output as soon as it is pumped
+        self.size, self.lines = 0, 0
+        with open(self.log_path, 'rb') as f:  # an earlier run of the app may have left lines in the segment
+            for block in iter(functools.partial(f.read, 1024 ** 2), b''):
+                self.size += len(block)
+                self.lines += block.count('\n')
+
+    def write(self, data):
+        while data:
+            room = self.segment_bytes - self.size
+            # the end of the first line reaching segment_bytes, 0 if there is none in data
+            cut = data.find('\n', max(room - 1, 0)) + 1 if len(data) >= room else 0
+            if not cut:
+                self._append(data)
+                return
+            self._append(data[:cut])
+            self._rotate()
+            data = data[cut:]
+
+    def close(self):
+        self._file.close()
+
+    def _append(self, data):
+        self._file.write(data)
+        self.size += len(data)
+        self.lines += data.count('\n')
+
+    def _rotate(self):
+        self._file.close()
+        seq = self.manifest['next-seq']
+        segment_path = '%s.%d' % (self.log_path, seq)
+        os.rename(self.log_path, segment_path)
+        self._file = open(self.log_path, 'ab', 0)
+        self.manifest['segments'].append({'seq': seq, 'lines': self.lines, 'bytes': self.size})
+        self.manifest['next-seq'] = seq + 1
+        self.manifest['active-inode'] = os.fstat(self._file.fileno()).st_ino
+        write_log_manifest(self.app_dir, self.manifest)
+        self.size, self.lines = 0, 0
+        try:
+            os.remove(self.app_dir + '/' + LOG_INDEX_FILE)  # it indexed the segment that was just rotated
+        except OSError:
+            pass
+
+        blocks = []
+        with open(segment_path, 'rb') as src, open(segment_path + '.gz.tmp', 'wb') as dst:
+            size, lines = 0, 0
+            for block in iter(functools.partial(src.read, self.block_bytes), b''):
+                if not block.endswith('\n'):
+                    block += src.readline()  # the next block starts at a line
+                blocks.append([size, dst.tell(), lines])
+                with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=self.compress_level) as member:
+                    member.write(block)
+                size += len(block)
+                lines += block.count('\n')
+        os.rename(segment_path + '.gz.tmp', segment_path + '.gz')
+        self.manifest['segments'][-1]['blocks'] = blocks
+        write_log_manifest(self.app_dir, self.manifest)
+        os.remove(segment_path)
+
+        if self.max_bytes is not None:
+            segments = self.manifest['segments']
+            disk_size = self.segment_bytes + sum(os.path.getsize('%s.%d.gz' % (self.log_path, segment['seq']))
+                                                 for segment in segments)
+            dropped = []
+            while segments and disk_size > self.max_bytes:
+                segment = segments.pop(0)
+                disk_size -= os.path.getsize('%s.%d.gz' % (self.log_path, segment['seq']))
+                self.manifest['dropped-lines'] += segment['lines']
+                self.manifest['dropped-bytes'] += segment['bytes']
+                dropped.append(segment)
+            if dropped:
+                write_log_manifest(self.app_dir, self.manifest)
+                for segment in dropped:
+                    os.remove('%s.%d.gz' % (self.log_path, segment['seq']))
+
+
+class AppLog(object):
+    """
+    consistent view of the log of an app across its segments: the rotated ones listed in LOG_MANIFEST_FILE, then
+    the LOG_FILE being written. Lines and bytes are numbered from the start of the whole log, including the segments
+    dropped to keep it under LOG_MAX_APP_BYTES: reads before them start at the oldest segment left.
+    rotated segments are read sequentially (they are at most LOG_SEGMENT_BYTES), LOG_FILE through its LogIndex.
+    """
+
+    def __init__(self, app_dir, log_indexes=None):
+        self.app_dir = app_dir
+        self.log_path = app_dir + '/' + LOG_FILE
+        self.log_indexes = log_indexes
+        for attempt in xrange(3):
+            self.manifest = read_log_manifest(app_dir)
+            try:
+                self.active = open(self.log_path, 'rb')
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                self.active = None
+                break
+            if self.manifest.get('active-inode', None) in (None, os.fstat(self.active.fileno()).st_ino) or \
+                    attempt == 2:
+                break
+            self.active.close()  # rotated between reading the manifest and opening LOG_FILE, read both again
+        self.segments = []  # (seq, first line, first byte, lines, bytes) of the rotated segments, oldest first
+        self.blocks = {}  # the compressed blocks of the segments by seq, see RotatingLogWriter
+        self.first_line, self.first_byte = self.manifest['dropped-lines'], self.manifest['dropped-bytes']
+        line_base, byte_base = self.first_line, self.first_byte
+        for segment in self.manifest['segments']:
+            self.segments.append((segment['seq'], line_base, byte_base, segment['lines'], segment['bytes']))
+            if segment.get('blocks'):
+                self.blocks[segment['seq']] = segment['blocks']
+            line_base += segment['lines']
+            byte_base += segment['bytes']
+        self.line_base, self.byte_base = line_base, byte_base  # of LOG_FILE
+        self.size = byte_base + (os.fstat(self.active.fileno()).st_size if self.active is not None else 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.active is not None:
+            self.active.close()
+
+    @property
+    def exists(self):
+        return self.active is not None or bool(self.segments)
+
+    def open_segment(self, seq, block=None):
+        """
+        :param seq: sequence number of a rotated segment
+        :param block: optional [byte, compressed byte, line] where a block of the segment starts, see find_block
+        :return: the segment opened for reading, from the start of block if given, None if it was dropped meanwhile
+        """
+        segment_path = '%s.%d' % (self.log_path, seq)
+        if block is not None:  # the blocks are listed once the segment is compressed
+            try:
+                f = gzip.open(segment_path + '.gz', 'rb')
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                return None
+            f.fileobj.seek(block[1])  # decompression starts at the gzip member of the block
+            return f
+        for path, opener in ((segment_path + '.gz', gzip.open), (segment_path, open)):  # it may not be compressed yet
+            try:
+                return opener(path, 'rb')
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        return None
+
+    def find_block(self, seq, offset=None, line=None):
+        """
+        :param seq: sequence number of a rotated segment
+        :param offset: byte offset in the segment
+        :param line: or line number in the segment
+        :return: the [byte, compressed byte, line] of the last block of the segment starting at or before offset (or
+                 line), None if the segment has no blocks listed
+        """
+        blocks = self.blocks.get(seq)
+        if not blocks:
+            return None
+        if offset is not None:
+            index = bisect.bisect_right([block[0] for block in blocks], offset) - 1
+        else:
+            index = bisect.bisect_right([block[2] for block in blocks], line) - 1
+        return blocks[max(index, 0)]
+
+    def read(self, cursor, max_bytes, complete_lines_only=True):
+        """
+        :param cursor: byte offset in the whole log
+        :param max_bytes: maximum number of bytes to read
+        :param complete_lines_only: whether an unterminated last line is held back until it is complete
+        :return: the content found after cursor, within a single segment, and the cursor where the next read starts
+        """
+        cursor = max(cursor, self.first_byte)
+        for seq, line_base, byte_base, lines, size in self.segments:
+            if cursor < byte_base + size:
+                block = self.find_block(seq, offset=cursor - byte_base)
+                f = self.open_segment(seq, block)
+                if f is None:
+                    cursor = byte_base + size
+                    continue
+                block_start = block[0] if block is not None else 0
+                with f:
+                    content, next_cursor = read_from_cursor(f, cursor - byte_base - block_start, max_bytes,
+                                                            complete_lines_only)
+                return content, byte_base + block_start + next_cursor
+        if self.active is None or cursor >= self.size:
+            return b'', cursor
+        content, next_cursor = read_from_cursor(self.active, cursor - self.byte_base, max_bytes, complete_lines_only)
+        return content, self.byte_base + next_cursor
+
+    def lines(self, offset, num_lines):
+        """
+        :param offset: 0-based number of the first line in the whole log
+        :param num_lines: maximum number of lines returned, all of them when negative
+        :return: list of the lines
+        """
+        lines = []
+        for seq, line_base, byte_base, count, size in self.segments:
+            if offset >= line_base + count:
+                continue
+            block = self.find_block(seq, line=max(offset - line_base, 0))
+            f = self.open_segment(seq, block)
+            if f is None:
+                continue
+            with f:
+                skipped = max(offset - line_base, 0) - (block[2] if block is not None else 0)
+                for line in itertools.islice(f, skipped, None):
+                    if 0 <= num_lines <= len(lines):
+                        return lines
+                    lines.append(line)
+        if self.active is not None:
+            self.log_indexes.get(self.log_path, self.active).seek(self.active, max(offset - self.line_base, 0))
+            lines.extend(itertools.islice(self.active, num_lines - len(lines) if num_lines >= 0 else None))
+        return lines
+
+    def iter_lines(self):
+        """
+        :return: iterator of the (line number, line) of the whole log, read sequentially segment after segment
+        """
+        for seq, line_base, byte_base, count, size in self.segments:
+            f = self.open_segment(seq)
+            if f is None:
+                continue
+            with f:
+                for number, line in enumerate(f, line_base):
+                    yield number, line
+        if self.active is not None:
+            self.active.seek(0)
+            for number, line in enumerate(self.active, self.line_base):
+                yield number, line
+
+    def tail(self, count, num_lines):
+        """
+        :param count: number of lines from the end of the whole log
+        :param num_lines: maximum number of lines returned, all of them when negative
+        :return: list of the lines
+        """
+        if self.active is not None:
+            offset = tail_offset(self.active, count)
+            if offset > 0 or not self.segments:  # the common case: the lines are all in LOG_FILE
+                self.active.seek(offset)
+                return list(itertools.islice(self.active, num_lines if num_lines >= 0 else None))
+            index = self.log_indexes.get(self.log_path, self.active)
+            partial_line = index.indexed_size < os.fstat(self.active.fileno()).st_size
+            total = self.line_base + index.line_count + (1 if partial_line else 0)
+        else:
+            total = self.line_base
+        return self.lines(max(total - count, 0), num_lines)
+
+
+class LogIndex(object):
+    """
+    sparse line-offset index of an app log, saved next to it in LOG_INDEX_FILE.
+    the byte offset of every stride-th line is recorded, and the index is extended from where the last refresh stopped,
+    so finding a line costs one seek plus reading at most stride lines, no matter how large the log is.
+    the saved index starts with the inode of the log it belongs to, so it is rebuilt once the log is rotated.
+    """
+
+    stride = 1000
+    _entry = struct.Struct('<Q')
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.index_path = os.path.join(os.path.dirname(log_path), LOG_INDEX_FILE)
+        self._lock = threading.Lock()
+        self._file_id = None
+        self._reset()
+
+    def _reset(self):
+        self.offsets = [0]  # byte offsets of the lines 0, stride, 2 * stride, ...
+        self.line_count = 0  # number of complete lines indexed so far
+        self.indexed_size = 0  # number of bytes of the log indexed so far
+
+    def refresh(self, f):
+        """
+        extends the index with the lines added to the log since the last refresh
+        :param f: the log opened in binary mode, its position is changed
+        :return: None
+        """
+        with self._lock:
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id != self._file_id or stat.st_size < self.indexed_size:
+                # first use, or the log was replaced: start over from the saved index (if it still fits the log)
+                self._file_id = file_id
+                self._reset()
+                self._load(stat)
+            if stat.st_size == self.indexed_size:
+                return
+            new_offsets = []
+            position = self.indexed_size
+            f.seek(position)
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # the last line is still being written
+                position += len(line)
+                self.line_count += 1
+                if self.line_count % self.stride == 0:
+                    new_offsets.append(position)
+            self.indexed_size = position
+            if new_offsets:
+                self.offsets.extend(new_offsets)
+                with open(self.index_path, 'ab') as index_file:
+                    index_file.seek(0, os.SEEK_END)
+                    if index_file.tell() == 0:
+                        index_file.write(self._entry.pack(stat.st_ino))
+                    index_file.write(''.join(self._entry.pack(offset) for offset in new_offsets))
+
+    def _load(self, stat):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return
+        entry_size = self._entry.size
+        values = [self._entry.unpack_from(data, i)[0] for i in xrange(0, len(data) - entry_size + 1, entry_size)]
+        if not values or values[0] != stat.st_ino or any(offset > stat.st_size for offset in values[1:]) or \
+                len(data) % entry_size:
+            os.remove(self.index_path)  # stale or partially written, rebuilt by the caller
+            return
+        offsets = values[1:]
+        self.offsets.extend(offsets)
+        self.line_count = (len(self.offsets) - 1) * self.stride
+        self.indexed_size = self.offsets[-1]
+
+    def seek(self, f, line_number):
+        """
+        moves f to the start of the given line
+        :param f: the log opened in binary mode
+        :param line_number: 0-based line number
+        :return: None
+        """
+        checkpoint = min(line_number // self.stride, len(self.offsets) - 1)
+        f.seek(self.offsets[checkpoint])
+        for i in xrange(line_number - checkpoint * self.stride):
+            if not f.readline():
+                break
+
+
+class LogIndexes(object):
+    """
+    the LogIndex of every app log read through the /logs endpoint, kept in memory between requests
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def get(self, log_path, f):
+        """
+        :param log_path: path to the LOG_FILE of an app
+        :param f: the log opened in binary mode
+        :return: the LogIndex of the log, up to date with f
+        """
+        log_path = os.path.normpath(log_path)
+        with self._lock:
+            index = self._indexes.get(log_path)
+            if index is None:
+                index = self._indexes[log_path] = LogIndex(log_path)
+        index.refresh(f)
+        return index
+
+    def discard(self, app_dir):
+        """forgets the index of an app log, e.g. once the app is renamed or deleted"""
+        with self._lock:
+            self._indexes.pop(os.path.normpath(app_dir + '/' + LOG_FILE), None)
+
+
+def tail_offset(f, num_lines, block_size=64 * 1024):
+    """
+    reads the file backwards from its end to find where its last num_lines lines start
+    :param f: file opened in binary mode
+    :param num_lines: number of lines wanted from the end of the file
+    :param block_size: number of bytes read at a time
+    :return: byte offset of the first of the last num_lines lines
+    """
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    position = end
+    newlines = 0
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        block = f.read(read_size)
+        index = len(block)
+        while True:
+            index = block.rfind('\n', 0, index)
+            if index < 0:
+                break
+            if position + index == end - 1:
+                continue  # the newline ending the last line doesn't start a line
+            newlines += 1
+            if newlines == num_lines:
+                return position + index + 1
+    return 0
+
+
+def read_from_cursor(f, cursor, max_bytes, complete_lines_only=True):
+    """
+    :param f: file opened in binary mode
+    :param cursor: byte offset to read from
+    :param max_bytes: maximum number of bytes to read
+    :param complete_lines_only: whether an unterminated last line is held back until it is complete
+    :return: the lines found after cursor, and the cursor where the next read should start
+    """
+    f.seek(cursor)
+    content = f.read(max_bytes)
+    end = content.rfind('\n') + 1
+    if complete_lines_only and (end or len(content) < max_bytes):
+        content = content[:end]  # an unterminated last line is returned once it is complete
+    return content, cursor + len(content)
+
+
+class LogHandler(SparkTKHandler):
+    """
+    implements the "logs" REST api endpoint.
+    offset and n select lines by number, a negative offset counts lines from the end of the log.
+    since is a byte cursor: the lines written after it are returned along with the next-cursor to use.
+    lines and bytes are numbered across the rotated segments of the log, see AppLog. The last lines of running jobs
+    are answered from their RecentLines when they are all in memory.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/logs -d "app-path=uploads/0001" -d "offset=1" -d "n=100"
+        curl http://<JUPYTER_NOTEBOOK_URL>/logs -d "app-path=uploads/0001" -d "offset=-100" -d "n=-1"
+        curl http://<JUPYTER_NOTEBOOK_URL>/logs -d "app-path=uploads/0001" -d "since=0"
+    """
+
+    @gen.coroutine
+    def post(self):
+        app_path = self.get_argument('app-path')
+        offset_str = self.get_argument('offset', '0', True)
+        num_lines_str = self.get_argument('n', '10', True)
+        since_str = self.get_argument('since', None, True)
+
+        try:
+            offset = int(offset_str)
+            num_lines = int(num_lines_str)
+            since = None if since_str is None else int(since_str)
+        except ValueError:
+            self.write("offset, n and since must be integers.")
+            return
+
+        if since is None and offset < 0:
+            # the last lines of a running job are served from memory, without going to the io pool
+            recent_lines = self.scheduler.recent_lines(app_path)
+            lines = recent_lines.tail(-offset, num_lines) if recent_lines is not None else None
+            if lines is not None:
+                self.write(''.join(lines))
+                return
+
+        self.write((yield self.read_log(app_path, offset, num_lines, since)))
+
+    @run_on_executor(executor='io_pool')
+    def read_log(self, app_path, offset, num_lines, since):
+        if os.path.isdir(app_path):
+            with AppLog(app_path, self.log_indexes) as log:
+                if log.exists:
+                    if since is not None:
+                        content, next_cursor = log.read(max(since, 0), APP_SETTINGS['LOG_CURSOR_MAX_BYTES'])
+                        return json.dumps({RESPONSE['LOG_CONTENT']: content.decode('utf-8', 'replace'),
+                                           RESPONSE['NEXT_CURSOR']: next_cursor})
+                    if offset < 0:
+                        return ''.join(log.tail(-offset, num_lines))
+                    return ''.join(log.lines(offset, num_lines))
+        return "Error, app-path %s doesn't exist or no logs exist yet" % (app_path)
+
+
+def search_log(log, regex, context=0, max_matches=1000):
+    """
+    scans the log once, keeping only the context lines in memory
+    :param log: an AppLog
+    :param regex: compiled regular expression searched in each line
+    :param context: number of lines returned before and after each line found
+    :param max_matches: maximum number of lines returned
+    :return: list of the lines found as dicts, and whether more lines matched
+    """
+    def text(line):
+        return line.rstrip(b'\n').decode('utf-8', 'replace')
+
+    matches = []
+    truncated = False
+    before = collections.deque(maxlen=context)
+    pending = []  # matches still missing lines after them
+    search = regex.search
+    for number, line in log.iter_lines():
+        if pending:
+            for match in pending:
+                match[RESPONSE['CONTEXT_AFTER']].append(text(line))
+            pending = [match for match in pending if len(match[RESPONSE['CONTEXT_AFTER']]) < context]
+        elif truncated:
+            break
+        if search(line) is not None:
+            if len(matches) < max_matches:
+                match = {RESPONSE['LINE_NUMBER']: number, RESPONSE['LINE']: text(line),
+                         RESPONSE['CONTEXT_BEFORE']: [text(previous) for previous in before],
+                         RESPONSE['CONTEXT_AFTER']: []}
+                matches.append(match)
+                if context:
+                    pending.append(match)
+            else:
+                truncated = True
+        before.append(line)
+    return matches, truncated
+
+
+class LogSearchHandler(SparkTKHandler):
+    """
+    implements the "logs/search" REST api endpoint.
+    returns the lines of the logs of one or many apps matching the regular expression pattern, with their line number
+    (the offset of /logs), up to max-matches lines per app and context lines before and after each of them.
+    ignore-case=true makes the search case insensitive. The whole log is searched, rotated segments included; the apps
+    are searched in parallel by the search pool (SPARKTK_EXT_LOG_SEARCH_THREADS) so /logs and uploads are not delayed.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/logs/search -d "app-path=uploads/0001" -d "pattern=Exception" -d "context=5"
+        curl http://<JUPYTER_NOTEBOOK_URL>/logs/search -d "app-path=uploads/0001" -d "app-path=uploads/0002" \
+            -d "pattern=^ERROR" -d "max-matches=10"
+    """
+
+    max_apps = 100
+    max_context = 100
+    max_matches = 1000
+
+    @gen.coroutine
+    def post(self):
+        app_paths = self.get_arguments('app-path')
+        pattern = self.get_argument('pattern')
+        context_str = self.get_argument('context', '0', True)
+        max_matches_str = self.get_argument('max-matches', str(self.max_matches), True)
+        ignore_case = self.get_argument('ignore-case', 'false', True).lower() in ('true', '1')
+
+        try:
+            context = int(context_str)
+            max_matches = int(max_matches_str)
+        except ValueError:
+            self.write("context and max-matches must be integers.")
+            return
+        if not 0 <= context <= self.max_context or not 0 < max_matches <= self.max_matches:
+            self.write("context must be between 0 and %d, max-matches between 1 and %d." %
+                       (self.max_context, self.max_matches))
+            return
+        if not app_paths or len(app_paths) > self.max_apps:
+            self.write("between 1 and %d app-path must be given." % (self.max_apps))
+            return
+        try:
+            regex = re.compile(pattern.encode('utf-8'), re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            self.write("Error, invalid pattern %s: %s" % (pattern, e))
+            return
+
+        results = yield [self.search_app(app_path, regex, context, max_matches)
+                         for app_path in collections.OrderedDict.fromkeys(app_paths)]
+        self.write(json.dumps({RESPONSE['APPS']: results}))
+
+    @run_on_executor(executor='search_pool')
+    def search_app(self, app_path, regex, context, max_matches):
+        result = {RESPONSE['APP_DIR']: app_path}
+        if os.path.isdir(app_path):
+            with AppLog(app_path, self.log_indexes) as log:
+                if log.exists:
+                    matches, truncated = search_log(log, regex, context, max_matches)
+                    result[RESPONSE['MATCHES']] = matches
+                    result[RESPONSE['TRUNCATED']] = truncated
+                    return result
+        result[RESPONSE['ERROR']] = "app-path %s doesn't exist or no logs exist yet" % (app_path)
+        return result
+
+
+class LogWatcher(object):
+    """
+    follows the log of one app on behalf of all its /logs/follow clients.
+    LogWatchers checks the log periodically; the lines added since the last check are read from disk once, on the io
+    pool, and kept in a bounded in-memory tail from which every client waiting for new lines is answered.
+    a new watcher starts with the last tail_size bytes of the log, and a check reads at most tail_size bytes: when more
+    was written meanwhile, only the end of it is kept. Clients behind the tail read the log themselves on the io pool.
+    the cursors are byte offsets in the whole log, across its rotated segments. The state of the watcher is only
+    changed on the IOLoop.
+    """
+
+    tail_size = 1024 ** 2
+
+    def __init__(self, app_dir, io_pool):
+        self.app_dir = app_dir
+        self.io_pool = io_pool
+        self.clients = 0
+        self.size = None  # bytes of the log read so far, None until the first check
+        self.finished = False
+        self.polling = False
+        self._tail = b''
+        self._tail_start = 0  # byte offset of the first byte of _tail in the log
+        self._waiters = []
+
+    @gen.coroutine
+    def read(self, cursor):
+        """
+        :param cursor: byte offset in the log
+        :return: Future resolved with the lines after cursor, and the cursor where the next read should start
+        """
+        max_bytes = APP_SETTINGS['LOG_CURSOR_MAX_BYTES']
+        if self.size is None or cursor >= self.size:
+            raise gen.Return((b'', cursor))
+        if cursor >= self._tail_start:
+            start = cursor - self._tail_start
+            content = self._tail[start:start + max_bytes]
+            end = content.rfind('\n') + 1
+            if end and len(content) == max_bytes:
+                content = content[:end]
+            raise gen.Return((content, cursor + len(content)))
+        # only clients lagging behind the in-memory tail go to the disk
+        raise gen.Return((yield self.io_pool.submit(self._read_log, cursor, min(max_bytes, self._tail_start - cursor))))
+
+    @gen.coroutine
+    def wait(self, cursor):
+        """
+        :param cursor: byte offset in the log
+        :return: Future resolved with (content, next cursor, finished) once there are lines after cursor,
+                 or the app finished running
+        """
+        while True:
+            content, next_cursor = yield self.read(cursor)
+            if content or self.finished:
+                raise gen.Return((content, next_cursor, self.finished and next_cursor >= self.size))
+            waiter = Future()
+            self._waiters.append(waiter)
+            yield waiter  # woken up by the next check of the log
+
+    @gen.coroutine
+    def poll(self, job_active):
+        """
+        reads what was added to the log since the last poll and wakes up the clients waiting for it
+        :param job_active: whether the app is still queued or running
+        :return: Future resolved once the clients are woken up
+        """
+        self.polling = True
+        try:
+            reads, log_size = yield self.io_pool.submit(self._read_new_lines, self.size, job_active)
+        finally:
+            self.polling = False
+        if self.size is None or log_size < self.size:  # first check, or the log was replaced
+            self.size = self._tail_start = reads[0][1] - len(reads[0][0]) if reads else log_size
+            self._tail = b''
+        for data, next_cursor in reads:
+            if next_cursor - len(data) != self.size:  # the lines after self.size were dropped or skipped
+                self._tail = b''
+                self._tail_start = next_cursor - len(data)
+            self.size = next_cursor
+            self._tail += data
+        if len(self._tail) > self.tail_size:
+            drop = len(self._tail) - self.tail_size
+            self._tail = self._tail[drop:]
+            self._tail_start += drop
+        self.finished = not job_active and self.size >= log_size
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter.set_result(None)
+
+    def _read_log(self, cursor, max_bytes):
+        with AppLog(self.app_dir) as log:
+            return log.read(cursor, max_bytes, complete_lines_only=False)
+
+    def _read_new_lines(self, size, complete_lines_only):
+        """
+        runs on the io pool
+        :param size: bytes of the log already read, None for a new watcher
+        :return: list of the (content, cursor after it) read after size, at most tail_size bytes from the end of the
+                 log, and the size of the log
+        """
+        with AppLog(self.app_dir) as log:
+            if size is None or size > log.size:  # new watcher, or the log was replaced
+                size = 0
+            cursor = max(size, log.size - self.tail_size, log.first_byte)
+            reads = []
+            while cursor < log.size:
+                # the content of a read stops at the end of its segment
+                data, next_cursor = log.read(cursor, self.tail_size, complete_lines_only)
+                if not data:
+                    break
+                reads.append((data, next_cursor))
+                cursor = next_cursor
+            return reads, log.size
+
+
+class LogWatchers(object):
+    """
+    the LogWatcher of every app log followed by at least one client.
+    a single periodic callback on the IOLoop polls all of them, so the number of disk reads does not grow with
+    the number of clients; the reads themselves run on the io pool.
+    """
+
+    def __init__(self, scheduler, io_pool, interval_ms=APP_SETTINGS['LOG_FOLLOW_INTERVAL_MS']):
+        self.scheduler = scheduler
+        self.io_pool = io_pool
+        self.interval_ms = interval_ms
+        self._watchers = {}
+        self._callback = None
+
+    def acquire(self, app_dir):
+        """
+        :param app_dir: the app directory whose log is followed
+        :return: the LogWatcher of the app log, to be given back with release once the client is done
+        """
+        app_dir = os.path.normpath(app_dir)
+        watcher = self._watchers.get(app_dir)
+        if watcher is None:
+            watcher = self._watchers[app_dir] = LogWatcher(app_dir, self.io_pool)
+            self._poll(watcher)
+        watcher.clients += 1
+        if self._callback is None:
+            self._callback = PeriodicCallback(self.poll, self.interval_ms)
+            self._callback.start()
+        return watcher
+
+    def release(self, watcher):
+        watcher.clients -= 1
+        if watcher.clients <= 0:
+            self._watchers.pop(watcher.app_dir, None)
+        if not self._watchers and self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    def poll(self):
+        for watcher in self._watchers.values():
+            if not watcher.polling:  # a slow check is not stacked with the next ones
+                self._poll(watcher)
+
+    def _poll(self, watcher):
+        IOLoop.current().add_future(watcher.poll(self.scheduler.is_active(watcher.app_dir)),
+                                    lambda future: future.result())  # errors are logged by the IOLoop
+
+
+class LogFollowHandler(SparkTKHandler):
+    """
+    implements the "logs/follow" REST api endpoint.
+    keeps the connection open until new lines are written to the log of the app, starting at the "since" byte cursor.
+    by default it long-polls: the json response has the new lines ("content"), the "next-cursor" and whether the app
+    "finished". Clients asking for text/event-stream (or mode=sse) get the lines as server-sent events instead,
+    until the app finishes; the id of each event is the cursor to resume from (Last-Event-ID).
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/logs/follow -d "app-path=uploads/0001" -d "since=0" -d "timeout=30"
+        curl -N http://<JUPYTER_NOTEBOOK_URL>/logs/follow -d "app-path=uploads/0001" -d "mode=sse"
+    """
+
+    keep_alive_seconds = 15
+
+    def compute_etag(self):
+        return None  # the sha1 of up to LOG_CURSOR_MAX_BYTES of lines would be computed on the IOLoop for nothing
+
+    def on_connection_close(self):
+        self.closed = True
+
+    @gen.coroutine
+    def get(self):
+        self.closed = False
+        app_path = self.get_argument('app-path')
+        since_str = self.get_argument('since', self.request.headers.get('Last-Event-ID', '0'), True)
+        timeout_str = self.get_argument('timeout', '30', True)
+        sse = self.get_argument('mode', '', True) == 'sse' or \
+            'text/event-stream' in self.request.headers.get('Accept', '')
+
+        try:
+            cursor = max(int(since_str), 0)
+            timeout = float(timeout_str)
+        except ValueError:
+            self.write("since must be an integer and timeout a number.")
+            return
+
+        if not (yield self.io_pool.submit(os.path.isdir, app_path)):
+            self.write("Error, app-path %s doesn't exist" % (app_path))
+            return
+
+        watcher = self.log_watchers.acquire(app_path)
+        try:
+            if sse:
+                yield self.stream_events(watcher, cursor)
+            else:
+                try:
+                    content, cursor, finished = yield gen.with_timeout(timedelta(seconds=timeout),
+                                                                       watcher.wait(cursor))
+                except gen.TimeoutError:
+                    content, finished = b'', False
+                self.write(json.dumps({RESPONSE['LOG_CONTENT']: content.decode('utf-8', 'replace'),
+                                       RESPONSE['NEXT_CURSOR']: cursor,
+                                       RESPONSE['LOG_FINISHED']: finished}))
+        finally:
+            self.log_watchers.release(watcher)
+
+    post = get
+
+    @gen.coroutine
+    def stream_events(self, watcher, cursor):
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+        while not self.closed:
+            try:
+                content, cursor, finished = yield gen.with_timeout(timedelta(seconds=self.keep_alive_seconds),
+                                                                   watcher.wait(cursor))
+            except gen.TimeoutError:
+                self.write(': keep-alive\n\n')
+                yield self.flush()
+                continue
+            if content:
+                lines = content.decode('utf-8', 'replace').splitlines()
+                self.write('id: %d\n%s\n' % (cursor, ''.join('data: %s\n' % line for line in lines)))
+            if finished:
+                self.write('event: end\ndata: \n\n')
+            yield self.flush()
+            if finished:
+                break
+
+
+class StatusHandler(SparkTKHandler):
+    """
+    implements the "status" REST api endpoint.
+    apps waiting for a free job slot also report their queue-position.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/status -d "app-path=uploads/0001"
+    """
+
+    @gen.coroutine
+    def post(self):
+        app_path = self.get_argument('app-path')
+
+        self.write((yield self.read_status(app_path)))
+
+    @run_on_executor(executor='io_pool')
+    def read_status(self, app_path):
+        status = self.registry.get(app_path) if os.path.exists(app_path) else None
+        if status is not None:
+            queue_position = self.scheduler.queue_position(app_path)
+            if queue_position is not None:
+                status[RESPONSE['QUEUE_POSITION']] = queue_position
+            return json.dumps(status)
+        else:
+            return "Error, app-path %s doesn't exist or no status exist yet" % (app_path)
+
+
+class AppsHandler(SparkTKHandler):
+    """
+    implements the "apps" REST api endpoint.
+    returns the status of many apps at once from the status registry, most recently updated first (order=asc for the
+    opposite). The list can be restricted to some app-path and status values, and is paginated: the next-cursor of a
+    response is passed as cursor to get the next page.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/apps
+        curl http://<JUPYTER_NOTEBOOK_URL>/apps -d "status=submitted" -d "status=uploaded" -d "limit=50"
+        curl http://<JUPYTER_NOTEBOOK_URL>/apps -d "app-path=uploads/0001" -d "app-path=uploads/0002"
+    """
+
+    max_limit = 1000
+
+    @gen.coroutine
+    def post(self):
+        app_paths = self.get_arguments('app-path') or None
+        statuses = self.get_arguments('status') or None
+        limit_str = self.get_argument('limit', '100', True)
+        cursor = self.get_argument('cursor', None, True)
+        ascending = self.get_argument('order', 'desc', True) == 'asc'
+
+        try:
+            limit = min(int(limit_str), self.max_limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            self.write("limit must be an integer > 0.")
+            return
+
+        self.write((yield self.list_apps(app_paths, statuses, limit, cursor, ascending)))
+
+    get = post
+
+    @run_on_executor(executor='io_pool')
+    def list_apps(self, app_paths, statuses, limit, cursor, ascending):
+        try:
+            apps, next_cursor = self.registry.list(app_paths, statuses, limit, cursor, ascending)
+        except (TypeError, ValueError):
+            return "Error, invalid cursor %s" % (cursor)
+
+        for status, created_at, updated_at in apps:
+            app_dir = status[RESPONSE['APP_DIR']]
+            status[RESPONSE['CREATED_AT']] = created_at
+            status[RESPONSE['UPDATED_AT']] = updated_at
+            status[RESPONSE['LOG_SIZE']] = get_log_size(app_dir)
+            if status[RESPONSE['APP_STATUS']] == APP_STATUS['SUBMITTED']:
+                queue_position = self.scheduler.queue_position(app_dir)
+                if queue_position is not None:
+                    status[RESPONSE['QUEUE_POSITION']] = queue_position
+        return json.dumps({RESPONSE['APPS']: [status for status, created_at, updated_at in apps],
+                           RESPONSE['NEXT_CURSOR']: next_cursor})
+
+
+class RenameHandler(SparkTKHandler):
+    """
+    implements the "rename" REST api endpoint.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/rename -d "app-path=uploads/0001" -d "dst-path=uploads/myapp"
+    """
+
+    @gen.coroutine
+    def post(self):
+        app_path = self.get_argument('app-path')
+        dst_path = self.get_argument('dst-path')
+
+        self.write((yield self.rename_app(app_path, dst_path)))
+
+    @run_on_executor(executor='io_pool')
+    def rename_app(self, app_path, dst_path):
+        if os.path.exists(app_path) and self.registry.get(app_path) is not None:
+            if self.registry.rename(app_path, dst_path):
+                self.log_indexes.discard(app_path)
+                return 'the new path for the app is %s' % (dst_path)
+            else:
+                return "Error, directory %s is in use, please try later" % (app_path)
+        else:
+            return "Error, app-path %s doesn't exist or not a valid path" % (app_path)
+
+
+def remove_app_dir(app_path):
+    """
+    :param app_path: the app directory to delete with all its content
+    :return: the number of bytes freed, the files still linked from elsewhere (e.g. blobs) are not counted
+    """
+    freed = 0
+    # TODO: Once jupyter image size is not an issue remove this and user shutil module
+    for root, dirs, files in os.walk(top=app_path, topdown=False):
+        for name in files:
+            stat = os.lstat(os.path.join(root, name))
+            if stat.st_nlink == 1:
+                freed += stat.st_size
+            os.remove(os.path.join(root, name))
+        for name in dirs:
+            os.rmdir(os.path.join(root, name))
+    os.rmdir(app_path)
+    return freed
+
+
+def get_app_dir_size(app_path, skip_hidden=False):
+    """
+    :param app_path: an app directory
+    :param skip_hidden: whether the files and directories at the top of app_path whose name starts with a dot are left
+                        out, e.g. the status database, the blob store and the submit cache of the uploads directory
+    :return: the size in bytes of the files in the directory, hard linked files are counted once
+    """
+    size = 0
+    linked = set()  # (st_dev, st_ino) of the files with several links already counted
+    for root, dirs, files in os.walk(app_path):
+        if skip_hidden and root == app_path:
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            files = [name for name in files if not name.startswith('.')]
+        for name in files:
+            stat = os.lstat(os.path.join(root, name))
+            if stat.st_nlink > 1:
+                if (stat.st_dev, stat.st_ino) in linked:
+                    continue
+                linked.add((stat.st_dev, stat.st_ino))
+            size += stat.st_size
+    return size
+
+
+class DeleteHandler(SparkTKHandler):
+    """
+    implements the "delete" REST api endpoint.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/delete -d "app-path=uploads/0001"
+    """
+
+    @gen.coroutine
+    def post(self):
+        app_path = self.get_argument('app-path')
+
+        self.write((yield self.delete_app(app_path)))
+
+    @run_on_executor(executor='io_pool')
+    def delete_app(self, app_path):
+        if os.path.exists(app_path) and self.registry.get(app_path) is not None:
+            if self.registry.remove(app_path):
+                remove_app_dir(app_path)
+                self.log_indexes.discard(app_path)
+                return "The app directory %s was successfully deleted" % (app_path)
+            else:
+                return "Error, directory %s is in use, please try later" % (app_path)
+        else:
+            return "Pass, app-path %s doesn't exist or not a valid path. No action is needed." % (app_path)
+
+
+class AppReaper(object):
+    """
+    removes finished apps (and their logs) in the background according to the retention settings:
+    apps not updated for max_age seconds, the oldest apps beyond max_apps, and the oldest apps while the uploads
+    directory is larger than max_bytes. SUBMITTED and UPLOADED apps are never removed.
+    the blobs of the blob_store no app links to anymore are removed after the apps.
+    each collection runs on the io pool every interval seconds, the space it reclaimed is logged and kept in stats.
+    """
+
+    def __init__(self, registry, log_indexes, io_pool, log, max_age=None, max_apps=None, max_bytes=None,
+                 uploads_path=APP_SETTINGS['UPLOADS_PATH'], blob_store=None):
+        self.registry = registry
+        self.log_indexes = log_indexes
+        self.io_pool = io_pool
+        self.log = log
+        self.max_age = max_age
+        self.max_apps = max_apps
+        self.max_bytes = max_bytes
+        self.uploads_path = uploads_path
+        self.blob_store = blob_store
+        self.stats = {'runs': 0, 'apps-removed': 0, 'blobs-removed': 0, 'bytes-reclaimed': 0}
+        self._callback = None
+        self._running = None
+
+    def start(self, interval):
+        """
+        :param interval: seconds between two collections
+        :return: None
+        """
+        if self.max_age is None and self.max_apps is None and self.max_bytes is None and self.blob_store is None:
+            return  # nothing to enforce
+        self._callback = PeriodicCallback(self._schedule, interval * 1000)
+        self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    def _schedule(self):
+        if self._running is None or self._running.done():
+            self._running = self.io_pool.submit(self.collect)
+
+    def collect(self):
+        """
+        removes the finished apps selected by the retention settings
+        :return: the number of apps removed and the number of bytes reclaimed
+        """
+        finished = []  # (updated_at, app_dir), oldest first
+        cursor = None
+        while True:
+            apps, cursor = self.registry.list(statuses=FINISHED_STATUSES, limit=1000, cursor=cursor, ascending=True)
+            finished.extend((updated_at, status[RESPONSE['APP_DIR']]) for status, created_at, updated_at in apps)
+            if cursor is None:
+                break
+
+        doomed = set()
+        if self.max_age is not None:
+            oldest_kept = time.time() - self.max_age
+            doomed.update(app_dir for updated_at, app_dir in finished if updated_at < oldest_kept)
+        if self.max_apps is not None and len(finished) > self.max_apps:
+            doomed.update(app_dir for updated_at, app_dir in finished[:len(finished) - self.max_apps])
+        if self.max_bytes is not None:
+            # only the apps count: the reaper can't reclaim the status database, the blobs or the submit cache
+            total_size = get_app_dir_size(self.uploads_path, skip_hidden=True) \
+                if os.path.isdir(self.uploads_path) else 0
+            total_size -= sum(get_app_dir_size(app_dir) for app_dir in doomed if os.path.isdir(app_dir))
+            for updated_at, app_dir in finished:
+                if total_size <= self.max_bytes:
+                    break
+                if app_dir not in doomed and os.path.isdir(app_dir):
+                    total_size -= get_app_dir_size(app_dir)
+                    doomed.add(app_dir)
+
+        removed, reclaimed = 0, 0
+        for app_dir in doomed:
+            status = self.registry.get(app_dir)
+            # the app may have been resubmitted since it was listed, remove() refuses SUBMITTED apps
+            if status is None or status[RESPONSE['APP_STATUS']] not in FINISHED_STATUSES or \
+                    not self.registry.remove(app_dir):
+                continue
+            if os.path.isdir(app_dir):
+                reclaimed += remove_app_dir(app_dir)
+            self.log_indexes.discard(app_dir)
+            removed += 1
+
+        blobs_removed = 0
+        if self.blob_store is not None:
+            blobs_removed, blobs_reclaimed = self.blob_store.collect()
+            reclaimed += blobs_reclaimed
+
+        self.stats['runs'] += 1
+        self.stats['apps-removed'] += removed
+        self.stats['blobs-removed'] += blobs_removed
+        self.stats['bytes-reclaimed'] += reclaimed
+        if removed or blobs_removed:
+            self.log.info("sparktk_ext: removed %d finished apps and %d unused blobs, reclaimed %d bytes" %
+                          (removed, blobs_removed, reclaimed))
+        return removed, reclaimed
+
+
+class Histogram(object):
+    """
+    cumulative histogram in the prometheus sense: the count of observations per upper bound, their sum and count
+    """
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one counts the observations above every bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        """
+        :param name: the metric name
+        :param labels: string of the labels of this histogram, without braces, may be empty
+        :return: list of the exposition lines of the histogram
+        """
+        separator = ',' if labels else ''
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append('%s_bucket{%s%sle="%s"} %d' % (name, labels, separator, bound, cumulative))
+        labels = '{%s}' % labels if labels else ''
+        lines.append('%s_sum%s %s' % (name, labels, repr(self.sum)))
+        lines.append('%s_count%s %d' % (name, labels, self.count))
+        return lines
+
+
+class Metrics(object):
+    """
+    counters and histograms of the extension, rendered in the prometheus text format by the /metrics endpoint.
+    observing is a dict lookup and a few additions under a lock; the gauges (queue depth, running jobs) are read when
+    the metrics are rendered, and the disk usage of the uploads directory is scanned every interval seconds on the
+    io pool, so none of it is computed on the request path.
+    """
+
+    request_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+    job_buckets = [1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600]
+
+    def __init__(self, io_pool, uploads_path=APP_SETTINGS['UPLOADS_PATH']):
+        self.io_pool = io_pool
+        self.uploads_path = uploads_path
+        self.requests = {}  # (path, method, code): count
+        self.request_durations = {}  # path: Histogram
+        self.job_durations = {}  # app status: Histogram
+        self.uploaded_files = 0
+        self.uploaded_bytes = 0
+        self.disk_usage = None  # bytes, None until the first scan
+        self._lock = threading.Lock()
+        self._callback = None
+        self._running = None
+
+    def observe_request(self, path, method, code, duration):
+        with self._lock:
+            key = (path, method, code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.request_durations.get(path)
+            if histogram is None:
+                histogram = self.request_durations[path] = Histogram(self.request_buckets)
+            histogram.observe(duration)
+
+    def observe_upload(self, files, size):
+        with self._lock:
+            self.uploaded_files += files
+            self.uploaded_bytes += size
+
+    def observe_job(self, app_status, duration):
+        with self._lock:
+            histogram = self.job_durations.get(app_status)
+            if histogram is None:
+                histogram = self.job_durations[app_status] = Histogram(self.job_buckets)
+            histogram.observe(duration)
+
+    def start(self, interval):
+        """
+        scans the disk usage now and then every interval seconds
+        :param interval: seconds between two scans
+        :return: None
+        """
+        self._schedule()
+        self._callback = PeriodicCallback(self._schedule, interval * 1000)
+        self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    def _schedule(self):
+        if self._running is None or self._running.done():
+            self._running = self.io_pool.submit(self.scan_disk_usage)
+
+    def scan_disk_usage(self):
+        self.disk_usage = get_app_dir_size(self.uploads_path) if os.path.isdir(self.uploads_path) else 0
+        return self.disk_usage
+
+    def render(self, scheduler, reaper=None):
+        """
+        :param scheduler: the JobScheduler, for the queue depth and running job gauges
+        :param reaper: optional AppReaper, for the apps it removed and the space it reclaimed
+        :return: the metrics in the prometheus text exposition format
+        """
+        lines = []
+
+        def add(name, kind, help_text, samples):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            lines.extend(samples)
+
+        with self._lock:
+            add('sparktk_http_requests_total', 'counter', 'REST requests handled, by path, method and status code',
+                ['sparktk_http_requests_total{path="%s",method="%s",code="%d"} %d' % (path, method, code, count)
+                 for (path, method, code), count in sorted(self.requests.iteritems())])
+            add('sparktk_http_request_duration_seconds', 'histogram', 'REST request latency, by path',
+                [line for path, histogram in sorted(self.request_durations.iteritems())
+                 for line in histogram.render('sparktk_http_request_duration_seconds', 'path="%s"' % path)])
+            add('sparktk_uploaded_files_total', 'counter', 'files stored by /upload',
+                ['sparktk_uploaded_files_total %d' % self.uploaded_files])
+            add('sparktk_uploaded_bytes_total', 'counter', 'bytes stored by /upload',
+                ['sparktk_uploaded_bytes_total %d' % self.uploaded_bytes])
+            add('sparktk_job_duration_seconds', 'histogram', 'run duration of the finished jobs, by app status',
+                [line for app_status, histogram in sorted(self.job_durations.iteritems())
+                 for line in histogram.render('sparktk_job_duration_seconds', 'status="%s"' % app_status)])
+        add('sparktk_jobs_queued', 'gauge', 'jobs waiting for a free slot',
+            ['sparktk_jobs_queued %d' % scheduler.queue_depth()])
+        add('sparktk_jobs_running', 'gauge', 'jobs running',
+            ['sparktk_jobs_running %d' % scheduler.running_count()])
+        if self.disk_usage is not None:
+            add('sparktk_uploads_disk_usage_bytes', 'gauge', 'size of the uploads directory at the last scan',
+                ['sparktk_uploads_disk_usage_bytes %d' % self.disk_usage])
+        if reaper is not None:
+            add('sparktk_reaper_removed_apps_total', 'counter', 'finished apps removed by the retention settings',
+                ['sparktk_reaper_removed_apps_total %d' % reaper.stats['apps-removed']])
+            add('sparktk_reaper_removed_blobs_total', 'counter', 'uploaded contents removed once no app used them',
+                ['sparktk_reaper_removed_blobs_total %d' % reaper.stats['blobs-removed']])
+            add('sparktk_reaper_reclaimed_bytes_total', 'counter', 'bytes reclaimed by the retention settings',
+                ['sparktk_reaper_reclaimed_bytes_total %d' % reaper.stats['bytes-reclaimed']])
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(SparkTKHandler):
+    """
+    implements the "metrics" REST api endpoint.
+    returns the request counts and latencies of the REST endpoints, the uploads, the scheduler queue and the job
+    durations, and the disk usage of the uploads directory in the prometheus text format.
+
+    Examples:
+        curl http://<JUPYTER_NOTEBOOK_URL>/metrics
+    """
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(self.metrics.render(self.scheduler, self.settings.get('sparktk_reaper')))
+
+
+def detach_before_save(blob_store, previous_hook, model, path, contents_manager, **kwargs):
+    """
+    pre_save_hook of the notebook contents manager: a file saved from Jupyter that links to a blob of the BlobStore
+    gets its own copy first, instead of being refused (blobs are read only) or changing every app sharing the blob
+    :param blob_store: the BlobStore of the extension
+    :param previous_hook: the pre_save_hook configured before the extension loaded, called afterwards
+    :return: None
+    """
+    if blob_store.detach(contents_manager._get_os_path(path)):
+        contents_manager.log.info("sparktk_ext: %s now has its own copy of its uploaded content" % path)
+    if previous_hook is not None:
+        previous_hook(model=model, path=path, contents_manager=contents_manager, **kwargs)
 
 
 def load_jupyter_server_extension(nb_app):
@@ -313,6 +3527,50 @@ def load_jupyter_server_extension(nb_app):
     '''
     web_app = nb_app.web_app
     host_pattern = '.*$'
+    web_app.settings['sparktk_io_pool'] = ThreadPoolExecutor(max_workers=APP_SETTINGS['IO_THREADS'])
+    web_app.settings['sparktk_search_pool'] = ThreadPoolExecutor(max_workers=APP_SETTINGS['LOG_SEARCH_THREADS'])
+    web_app.settings['sparktk_metrics'] = Metrics(web_app.settings['sparktk_io_pool'], APP_SETTINGS['UPLOADS_PATH'])
+    web_app.settings['sparktk_metrics'].start(APP_SETTINGS['METRICS_DISK_INTERVAL_S'])
+    web_app.settings['sparktk_registry'] = StatusRegistry(APP_SETTINGS['STATUS_DB'], nb_app.log)
+    web_app.settings['sparktk_registry'].import_apps(APP_SETTINGS['UPLOADS_PATH'])
+    web_app.settings['sparktk_scheduler'] = JobScheduler(web_app.settings['sparktk_registry'],
+                                                         APP_SETTINGS['MAX_RUNNING_JOBS'],
+                                                         metrics=web_app.settings['sparktk_metrics'])
+    classpath = SparkTKClasspath(APP_SETTINGS['CLASSPATH_CACHE_FILE'], APP_SETTINGS['CLASSPATH_MANIFEST'])
+    try:
+        classpath.get()  # search the jars now rather than on the first spark-submit
+    except (KeyError, IOError, OSError, ValueError) as e:
+        nb_app.log.warning("sparktk_ext: could not build the spark-submit classpath yet: %s" % e)
+    web_app.settings['sparktk_classpath'] = classpath
+    driver_pool = None
+    if APP_SETTINGS['DRIVER_POOL_SIZE'] > 0:
+        driver_pool = DriverPool(APP_SETTINGS['DRIVER_POOL_SIZE'], classpath, nb_app.log)
+        driver_pool.start()
+    web_app.settings['sparktk_driver_pool'] = driver_pool
+    web_app.settings['sparktk_submit_cache'] = SubmitCache(APP_SETTINGS['SUBMIT_CACHE_PATH'],
+                                                           APP_SETTINGS['SUBMIT_CACHE_MAX_BYTES'])
+    web_app.settings['sparktk_batches'] = Batches(web_app.settings['sparktk_registry'], IOLoop.current(),
+                                                  APP_SETTINGS['BATCHES_KEPT'])
+    web_app.settings['sparktk_upload_dirs'] = UploadDirAllocator(APP_SETTINGS['UPLOADS_PATH'])
+    blob_store = None
+    if APP_SETTINGS['DEDUPLICATE_UPLOADS']:
+        blob_store = BlobStore(APP_SETTINGS['BLOBS_PATH'])
+        contents_manager = getattr(nb_app, 'contents_manager', None)
+        if hasattr(contents_manager, '_get_os_path'):  # contents on the local file system
+            contents_manager.pre_save_hook = functools.partial(detach_before_save, blob_store,
+                                                               contents_manager.pre_save_hook)
+    web_app.settings['sparktk_blob_store'] = blob_store
+    web_app.settings['sparktk_log_indexes'] = LogIndexes()
+    web_app.settings['sparktk_log_watchers'] = LogWatchers(web_app.settings['sparktk_scheduler'],
+                                                           web_app.settings['sparktk_io_pool'],
+                                                           APP_SETTINGS['LOG_FOLLOW_INTERVAL_MS'])
+    reaper = AppReaper(web_app.settings['sparktk_registry'], web_app.settings['sparktk_log_indexes'],
+                       web_app.settings['sparktk_io_pool'], nb_app.log,
+                       max_age=APP_SETTINGS['RETENTION_MAX_AGE_S'], max_apps=APP_SETTINGS['RETENTION_MAX_APPS'],
+                       max_bytes=APP_SETTINGS['RETENTION_MAX_BYTES'], uploads_path=APP_SETTINGS['UPLOADS_PATH'],
+                       blob_store=blob_store)
+    reaper.start(APP_SETTINGS['GC_INTERVAL_S'])
+    web_app.settings['sparktk_reaper'] = reaper
     web_app.settings["jinja2_env"].loader.searchpath += [
         os.path.join(os.path.dirname(__file__), "templates")
     ]
@@ -321,9 +3579,16 @@ def load_jupyter_server_extension(nb_app):
                              (r"/hello", IndexHandler),
                              (r"/upload", UploadHandler),
                              (r"/spark-submit", SparkSubmitHandler),
+                             (r"/batch-submit", BatchSubmitHandler),
+                             (r"/batch-status", BatchStatusHandler),
+                             (r"/cancel", CancelHandler),
                              (r"/rename", RenameHandler),
                              (r"/delete", DeleteHandler),
                              (r"/logs", LogHandler),
+                             (r"/logs/follow", LogFollowHandler),
+                             (r"/logs/search", LogSearchHandler),
                              (r"/status", StatusHandler),
+                             (r"/apps", AppsHandler),
+                             (r"/metrics", MetricsHandler),
                          ]
                          )
@@ -19,10 +19,24 @@
 Pretty-printing tabular data
 """
 
+import sys
 from datetime import datetime
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pytz
+    utc = pytz.utc
+except ImportError:
+    utc = None  # timestamps are then formatted in local time, see ms_to_datetime_str
+
 spaces_between_cols = 2  # consts
 ellipses = '...'
+datetime_format = "%Y-%m-%dT%H:%M:%S.%fZ"
+datetime_cache_size = 10000  # formatted timestamps kept by a datetime formatter
 
 
 class Formatting(object):
@@ -205,18 +219,26 @@ with_types %8s""" % (self.wrap, self.truncate, self.round, self.width, self.marg
 class ATable(object):
     """
     Class for representing tabular data as a string, where the __repr__ is the main use case
+
+    rows is either a list of rows, or column-oriented data rendered without building the rows: a dict of columns by
+    name, a 2-dimensional or structured numpy array, or a pandas DataFrame (see dataframe_to_atable)
     """
 
     def __init__(self, rows, schema, offset, format_settings=None):
+        self.columns = _get_columns(rows, schema)  # None for a list of rows
+        if self.columns is not None:
+            rows = ColumnarRows(self.columns)
         if not format_settings:
             format_settings = Formatting()
         if not isinstance(format_settings, Formatting):
             raise TypeError("argument format_settings must be type %s" % Formatting)
         if format_settings.wrap == 'stripes':
             self._repr = self._repr_stripes
+            self._iter_lines = self._iter_stripes_lines
         else:
             self.wrap = min(format_settings.wrap, len(rows)) or len(rows)
             self._repr = self._repr_wrap
+            self._iter_lines = self._iter_wrap_lines
 
         self.rows = rows
         self.schema = schema
@@ -227,12 +249,35 @@ class ATable(object):
         self.margin = format_settings.margin
         self.with_types = format_settings.with_types
         self.value_formatters = [self._get_value_formatter(data_type) for name, data_type in schema]
+        self.column_formatters = [self._get_column_formatter(data_type) for name, data_type in schema]
 
     def __repr__(self):
         return self._repr()
 
+    def iter_lines(self):
+        """
+        generates the lines of the table (without line endings) one row clump at a time, so only the clump being
+        rendered is held in memory; "\n".join(table.iter_lines()) is repr(table)
+        """
+        return self._iter_lines()
+
+    def render_to(self, stream):
+        """
+        writes the table to the stream (a file, a pager, a notebook output...) as it is rendered, each line followed
+        by a newline
+
+        :param stream: object with a write method
+        """
+        for line in self.iter_lines():
+            stream.write(line)
+            stream.write('\n')
+
     def _repr_wrap(self):
         """print rows in a 'clumps' style"""
+        return "\n".join(self._iter_wrap_lines())
+
+    def _iter_wrap_lines(self):
+        """generates the lines of the rows in a 'clumps' style"""
         row_index_str_format = '[%s]' + ' ' * spaces_between_cols
 
         def _get_row_index_str(index):
@@ -242,10 +287,9 @@ class ATable(object):
         row_clump_count = _get_row_clump_count(row_count, self.wrap)
         header_sizes = _get_header_entry_sizes(self.schema, self.with_types)
         column_spacer = ' ' * spaces_between_cols
-        lines_list = []
-        extra_tuples = []
 
         for row_clump_index in xrange(row_clump_count):
+            lines_list = []
             if row_clump_index > 0:
                 lines_list.append('')  # extra line for new clump
             start_row_index = row_clump_index * self.wrap
@@ -254,7 +298,15 @@ class ATable(object):
                 stop_row_index = row_count
             row_index_header = _get_row_index_str('#' * len(str(self.offset+stop_row_index-1)))
             margin = len(row_index_header)
-            col_sizes = _get_col_sizes(self.rows, start_row_index, self.wrap, header_sizes, self.value_formatters)
+            if self.columns is None:
+                columns = zip(*self.rows[start_row_index:stop_row_index]) or [()] * len(self.schema)
+            else:
+                columns = [column[start_row_index:stop_row_index] for column in self.columns]
+            # each cell of the clump is formatted once, for both the column sizes and the lines
+            formatted_columns, col_sizes = _format_clump(columns, header_sizes, self.value_formatters,
+                                                         self.column_formatters)
+            row_labels = [pad_right(_get_row_index_str(self.offset+row_index), margin)
+                          for row_index in xrange(start_row_index, stop_row_index)]
             col_index = 0
             while col_index < len(self.schema):
                 num_cols = _get_num_cols(self.schema, self.width, col_index, col_sizes, margin)
@@ -264,17 +316,21 @@ class ATable(object):
                 thick_line = "=" * len(header_line)
                 lines_list.extend(["", header_line, thick_line])
                 if row_count:
-                    for row_index in xrange(start_row_index, stop_row_index):
-                        new_line = pad_right(_get_row_index_str(self.offset+row_index), margin) + column_spacer.join([self._get_wrap_entry(data, col_sizes[col_index+i], self.value_formatters[col_index+i], i, extra_tuples) for i, data in enumerate(self.rows[row_index][col_index:col_index+num_cols])])
-                        lines_list.append(new_line.rstrip())
-                        if extra_tuples:
-                            lines_list.extend(_get_lines_from_extra_tuples(extra_tuples, col_sizes[col_index:col_index+num_cols], margin))
+                    lines_list.extend(_get_wrap_lines(row_labels, formatted_columns[col_index:col_index+num_cols],
+                                                      col_sizes[col_index:col_index+num_cols], margin))
                 col_index += num_cols
 
-        return "\n".join(lines_list[1:])  # 1: skips the first blank line caused by the algo
+            if row_clump_index == 0 and lines_list:
+                del lines_list[0]  # skips the first blank line caused by the algo
+            for line in lines_list:
+                yield line
 
     def _repr_stripes(self):
         """print rows as stripes style"""
+        return "\n".join(self._iter_stripes_lines())
+
+    def _iter_stripes_lines(self):
+        """generates the lines of the rows as stripes style"""
         max_margin = 0
         for name, data_type in self.schema:
             length = len(_get_header_entry(name, data_type, self.with_types)) + 1 # to account for the '='
@@ -282,13 +338,11 @@ class ATable(object):
                 max_margin = length
         if not self.margin or max_margin < self.margin:
             self.margin = max_margin
-        lines_list = []
         rows = self.rows or [['' for entry in self.schema]]
         for row_index in xrange(len(rows)):
-            lines_list.append(self._get_stripe_header(self.offset+row_index))
-            lines_list.extend([self._get_stripe_entry(i, name, data_type, value)
-                               for i, ((name, data_type), value) in enumerate(zip(self.schema, rows[row_index]))])
-        return "\n".join(lines_list)
+            yield self._get_stripe_header(self.offset+row_index)
+            for i, ((name, data_type), value) in enumerate(zip(self.schema, rows[row_index])):
+                yield self._get_stripe_entry(i, name, data_type, value)
 
     def _get_stripe_header(self, index):
         row_number = "[%s]" % index
@@ -311,23 +365,29 @@ class ATable(object):
             return self.get_truncator(self.truncate)
         return identity
 
-    @staticmethod
-    def _get_wrap_entry(data, size, formatter, relative_column_index, extra_tuples):
-        entry = unicode(formatter(data)).encode('utf-8')
-        if isinstance(data, basestring):
-            lines = entry.splitlines()
-            if len(lines) > 1:
-                entry = lines[0]  # take the first line now, and save the rest in an 'extra' tuple
-                extra_tuples.append((relative_column_index, lines[1:]))
-            return pad_right(entry, size)
-        elif data is None or isinstance(data, list) or isinstance(data, tuple):
-            return pad_right(entry, size)
-        else:
-            return pad_left(entry, size)
+    def _get_column_formatter(self, data_type):
+        """
+        :return: function formatting a numpy array at once, like its value formatter does one value at a time, or None
+                 when the values of the data_type are only formatted one by one
+        """
+        if self.round:
+            if hasattr(data_type, "get_atable_rounder"):
+                return None
+            if hasattr(data_type, "round") or data_type is float:
+                return get_numbers_rounder(self.round)
+        if hasattr(data_type, "get_atable_formatter"):
+            return None
+        if data_type is datetime:
+            return format_datetimes
+        if self.truncate and (data_type is str or data_type is unicode):
+            return None
+        return format_numbers
 
     @staticmethod
     def get_truncator(target_len):
         def truncate_string(s):
+            if not isinstance(s, basestring):
+                return s  # e.g. the NaN of the missing strings of a pandas column
             return truncate(s, target_len)
         return truncate_string
 
@@ -337,23 +397,33 @@ class ATable(object):
             return float_type.get_atable_rounder(num_digits)
 
         if hasattr(float_type, "round") or float_type is float:
+            template = "%%.%df" % num_digits
+
             def rounder(value):
                 if value is None:
                     return None
-                template = "%%.%df" % num_digits
                 return template % value
             return rounder
 
         return None
 
     def get_datetime_formatter(self):
+        cache = {}  # the strings of the timestamps already formatted, listings often repeat them
+
         def format_datetime(d):
             if d is None:
                 return None
-            elif isinstance(d, long) or isinstance(d, int):
-                return ms_to_datetime_str(d)
-            elif isinstance(d, datetime):
-                return d.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            elif isinstance(d, (int, long, datetime)):
+                s = cache.get(d)
+                if s is None:
+                    if len(cache) >= datetime_cache_size:
+                        cache.clear()
+                    if isinstance(d, datetime):
+                        s = d.strftime(datetime_format)
+                    else:
+                        s = ms_to_datetime_str(d)
+                    cache[d] = s
+                return s
             else:
                 return str(d)
         return format_datetime
@@ -389,22 +459,41 @@ def dictionaries_to_atable(dictionaries, keys=None, formatting=None):
     return ATable(rows, schema, offset=0, format_settings=formatting)
 
 
+def dataframe_to_atable(dataframe, keys=None, formatting=None):
+    """
+    Create an ATable object using a pandas DataFrame, rendered from its columns without converting it to rows
+
+    :param dataframe: (pandas.DataFrame) content
+    :param keys: (list) if specified, the results will only include this list of columns
+    :param formatting: (Formatting) Optional formatting object from ATable
+    :return: new ATable object
+    """
+
+    if keys is not None:
+        dataframe = dataframe[keys]
+
+    schema = [(name if isinstance(name, basestring) else str(name), dtype_to_type(dtype))
+              for name, dtype in zip(dataframe.columns, dataframe.dtypes)]
+
+    return ATable(dataframe, schema, offset=0, format_settings=formatting)
+
+
+_pytz_warned = False  # the warning is written once
+
+
 def ms_to_datetime_str(ms):
     """
     Returns the date/time string for the specified timestamp (milliseconds since epoch).
     :param ms: Milliseconds since epoch (int or long)
     :return: Date/time string
     """
-    try:
-        import pytz
-        tz =pytz.utc
-    except ImportError:
-        import sys
+    global _pytz_warned
+    if utc is None and not _pytz_warned:
         sys.stderr.write("WARNING: pytz not installed, setting timezone argument to None")
-        tz=None
+        _pytz_warned = True
 
     if isinstance(ms, long) or isinstance(ms, int):
-        return datetime.fromtimestamp(ms/1000.0, tz=tz).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        return datetime.fromtimestamp(ms/1000.0, tz=utc).strftime(datetime_format)
     else:
         raise TypeError("Unable to convert timestamp milliseconds to a date/time string, because the value provided " +
                         "is not a long/int.  Unsupported type: %s" % type(ms))
@@ -421,6 +510,21 @@ def type_to_simple_name(data_type):
     except AttributeError:
         return '<unknown>'
 
+def dtype_to_type(dtype):
+    """returns the data_type of the schema of a column of the given numpy dtype"""
+    kind = dtype.kind
+    if kind == 'f':
+        return float
+    if kind in 'iu':
+        return int
+    if kind == 'b':
+        return bool
+    if kind == 'M':
+        return datetime
+    if kind == 'U':
+        return unicode
+    return str
+
 def _get_header_entry_sizes(schema, with_types):
     return [len(_get_header_entry(name, data_type, with_types)) for name, data_type in schema]
 
@@ -448,23 +552,196 @@ def identity(value):
     return value
 
 
-def _get_col_sizes(rows, row_index, row_count, header_sizes, formatters):
+def format_numbers(values):
+    """formats a numpy array of numbers like unicode does each of them, returns None for other arrays"""
+    if values.dtype.kind not in 'biuf':
+        return None
+    return map(str, values.tolist())
+
+
+def get_numbers_rounder(num_digits):
+    """returns a function formatting a numpy array of numbers like the rounder of ATable.get_rounder"""
+    template = "%%.%df" % num_digits
+
+    def round_numbers(values):
+        if values.dtype.kind not in 'biuf':
+            return None
+        return map(template.__mod__, values.tolist())
+    return round_numbers
+
+
+def format_datetimes(values):
+    """
+    formats a numpy array of datetime64, or of int milliseconds since epoch, like the datetime formatter of ATable
+    does each of them (in UTC, computed in bulk by numpy), returns None for other arrays
+    """
+    kind = values.dtype.kind
+    if kind in 'iu':
+        if utc is None:
+            return None  # ms_to_datetime_str gives the local time
+        values = values.astype('datetime64[ms]')
+    elif kind != 'M' or numpy.isnat(values).any():
+        return None  # NaT are formatted one by one, as None
+    return numpy.datetime_as_string(values, unit='us', timezone='UTC').astype(str).tolist()
+
+
+class ColumnarRows(object):
+    """
+    Read-only sequence of the rows of column-oriented data, each row being built when it is accessed
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self._len = len(columns[0]) if columns else 0
+        if any(len(column) != self._len for column in columns):
+            raise ValueError("Bad columns, they must all have the same length")
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            return [list(row) for row in zip(*[_to_list(column[start:stop:step]) for column in self.columns])]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("row index out of range")
+        return [_to_list(column[index:index+1])[0] for column in self.columns]
+
+    def __iter__(self):
+        for index in xrange(self._len):
+            yield self[index]
+
+
+def _get_columns(data, schema):
+    """
+    returns the list of the columns of column-oriented data, in the order of the schema, or None for a list of rows
+    """
+    if isinstance(data, dict):
+        return [_get_column(data[name]) for name, data_type in schema]
+    if hasattr(data, 'iloc') and hasattr(data, 'columns'):  # pandas DataFrame, by position like the numpy arrays
+        return [data.iloc[:, c].values for c in xrange(len(schema))]
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        if data.dtype.names:
+            return [data[name] for name, data_type in schema]
+        if data.ndim != 2:
+            raise ValueError("Bad numpy array of %s dimension(s), rows must be 2-dimensional or structured" %
+                             data.ndim)
+        return [data[:, c] for c in xrange(len(schema))]
+    return None
+
+
+def _get_column(values):
+    if hasattr(values, 'iloc'):  # pandas Series
+        return values.values
+    return values
+
+
+def _to_list(values):
+    """returns the python values of a column, e.g. datetime for numpy datetime64"""
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        if values.dtype.kind == 'M':
+            values = values.astype('datetime64[us]')  # to datetime, not to long nanoseconds
+        return values.tolist()
+    if hasattr(values, 'tolist'):  # e.g. pandas Categorical
+        return values.tolist()
+    return values
+
+
+def _format_clump(columns, header_sizes, formatters, column_formatters):
+    """
+    formats the cells of a clump once, column by column, for both the column sizes and the lines; the columns held in
+    numpy arrays are formatted at once by their column formatter, when they have one for the dtype
+
+    :param columns: the values of each column for the rows of the clump
+    :return: the list of the formatted columns, as (utf-8 entries, alignment, extra lines) tuples where an entry is the
+             first line of multi-line strings, the alignment is True (right), False (left) or the list of the alignment
+             of each entry, and the extra lines is the dict of the rest of the lines of the entries by row, and the
+             column sizes
+    """
     sizes = list(header_sizes)
-    for r in xrange(row_index, row_index+row_count):
-        if r < len(rows):
-            row = rows[r]
-            for c in xrange(len(sizes)):
-                value = row[c]
-                entry = unicode(formatters[c](value))
+    formatted_columns = []
+    for c in xrange(len(sizes)):
+        values = columns[c]
+        entries = None
+        if column_formatters[c] is not None and numpy is not None and isinstance(values, numpy.ndarray):
+            entries = column_formatters[c](values)
+        if entries is not None:
+            formatted_columns.append((entries, True, None))
+            width = max(map(len, entries) or [0])
+        else:
+            formatted, width = _format_values(_to_list(values), formatters[c])
+            formatted_columns.append(formatted)
+        if width > sizes[c]:
+            sizes[c] = width
+    return formatted_columns, sizes
+
+
+def _format_values(values, formatter):
+    """
+    formats the values of a column of a clump one by one
+
+    :return: the formatted column (see _format_clump) and its width
+    """
+    entries = []
+    aligns = []
+    extra_lines = {}
+    width = 0
+    for value in values:
+        entry = unicode(formatter(value))
+        lines = entry.splitlines()
+        if len(lines) == 1:
+            entry_width = len(lines[0])
+        else:
+            entry_width = max([len(line) for line in lines] or [0])
+        if entry_width > width:
+            width = entry_width
+        entry = entry.encode('utf-8')
+        if isinstance(value, basestring):
+            if len(lines) > 1:
                 lines = entry.splitlines()
-                max = 0
-                for line in lines:
-                    length = len(line)
-                    if length > max:
-                        max = length
-                if max > sizes[c]:
-                    sizes[c] = max
-    return sizes
+                if len(lines) > 1:
+                    extra_lines[len(entries)] = lines[1:]
+                    entry = lines[0]
+            aligns.append(False)
+        else:
+            aligns.append(not (value is None or isinstance(value, (list, tuple))))
+        entries.append(entry)
+    if not aligns or aligns.count(aligns[0]) == len(aligns):
+        aligns = aligns[0] if aligns else True
+    return (entries, aligns, extra_lines), width
+
+
+def _get_wrap_lines(row_labels, formatted_columns, col_sizes, margin):
+    """
+    :param row_labels: the row index strings of the clump, padded to the margin
+    :param formatted_columns: the formatted columns (see _format_clump) fitting on a line
+    :param col_sizes: the sizes of these columns
+    :return: the lines of the rows of the clump, each followed by the rest of the lines of its multi-line entries
+    """
+    templates = []
+    columns = [row_labels]
+    for (entries, align, extra_lines), size in zip(formatted_columns, col_sizes):
+        if align is True:
+            templates.append('%%%ds' % size)  # pad_left
+        elif align is False:
+            templates.append('%%-%ds' % size)  # pad_right
+        else:
+            entries = [entry.rjust(size) if right else entry.ljust(size) for entry, right in zip(entries, align)]
+            templates.append('%s')
+        columns.append(entries)
+    template = '%s' + (' ' * spaces_between_cols).join(templates)
+    extras = [(i, extra_lines) for i, (entries, align, extra_lines) in enumerate(formatted_columns) if extra_lines]
+    if not extras:
+        return [(template % values).rstrip() for values in zip(*columns)]
+    lines = []
+    for row, values in enumerate(zip(*columns)):
+        lines.append((template % values).rstrip())
+        extra_tuples = [(i, list(extra_lines[row])) for i, extra_lines in extras if row in extra_lines]
+        if extra_tuples:
+            lines.extend(_get_lines_from_extra_tuples(extra_tuples, col_sizes, margin))
+    return lines
 
 
 def _get_num_cols(schema, width, start_col_index, col_sizes, margin):
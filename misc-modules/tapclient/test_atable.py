@@ -0,0 +1,44 @@
+"""
+tests of the ATable rendering, run with: python -m unittest discover -s misc-modules/tapclient
+"""
+
+import StringIO
+import unittest
+
+from atable import ATable, Formatting, dictionaries_to_atable
+
+
+class TestEmptySchema(unittest.TestCase):
+    """a table without columns renders its row labels (if any) instead of failing"""
+
+    def test_wrap_without_rows(self):
+        table = dictionaries_to_atable([], formatting=Formatting(wrap=5))
+        self.assertEqual(repr(table), '')
+        self.assertEqual(list(table.iter_lines()), [])
+
+    def test_wrap_with_rows(self):
+        for wrap in [1, 5]:
+            table = dictionaries_to_atable([{}, {}], formatting=Formatting(wrap=wrap))
+            self.assertEqual(repr(table), '')
+
+    def test_stripes(self):
+        self.assertEqual(repr(dictionaries_to_atable([], formatting=Formatting(wrap='stripes'))), '[0]')
+        self.assertEqual(repr(dictionaries_to_atable([{}, {}], formatting=Formatting(wrap='stripes'))), '[0]\n[1]')
+
+    def test_render_to(self):
+        for wrap in [5, 'stripes']:
+            table = ATable([], [], 0, Formatting(wrap=wrap))
+            stream = StringIO.StringIO()
+            table.render_to(stream)
+            self.assertEqual(stream.getvalue(), ''.join(line + '\n' for line in table.iter_lines()))
+
+
+class TestWrap(unittest.TestCase):
+
+    def test_clumps(self):
+        table = ATable([[1], [2]], [('a', int)], 0, Formatting(wrap=1))
+        self.assertEqual(repr(table), '[#]  a\n======\n[0]  1\n\n\n[#]  a\n======\n[1]  2')
+
+
+if __name__ == '__main__':
+    unittest.main()